@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from .models import LabelsModel, CarsModel, UserCarsRelation
+from .models import LabelsModel, CarsFacetCount, CarsModel, RatingQueue, UserCarsRelation
 
 admin.site.register(LabelsModel)
 admin.site.register(CarsModel)
-admin.site.register(UserCarsRelation)
\ No newline at end of file
+admin.site.register(UserCarsRelation)
+admin.site.register(RatingQueue)
+admin.site.register(CarsFacetCount)
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CarConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Car'
+
+    def ready(self):
+        from django.core.signals import request_started
+
+        from rest_api.db import check_connections
+
+        from . import cache  # noqa: F401 подключает сигналы инвалидации кэша
+
+        request_started.connect(check_connections)
@@ -0,0 +1,178 @@
+import json
+import random
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+from .models import CarsModel, LabelsModel
+from .seed import SEED_MODELS
+
+
+def _list(rng, data):
+    return 'GET', '/cars/', None
+
+
+def _search(rng, data):
+    return 'GET', f'/cars/?search={rng.choice(SEED_MODELS)}', None
+
+
+def _filter(rng, data):
+    chance = rng.random()
+    if chance < 0.3:
+        return 'GET', f'/cars/?price={rng.randrange(100000, 5000000, 50000)}', None
+    if chance < 0.7:
+        low = rng.randrange(100000, 4000000, 50000)
+        return 'GET', f'/cars/?price__gte={low}&price__lte={low + 1000000}' \
+                      f'&year_of_release__gte={rng.randint(1990, 2015)}&engine_type={rng.choice(("p", "d"))}' \
+                      f'&body_type=s&body_type=u&ordering=-date', None
+    return 'GET', f'/cars/?likes_count__gte={rng.randint(0, 3)}&ordering=-likes_count', None
+
+
+def _ordering(rng, data):
+    return 'GET', f'/cars/?ordering={rng.choice(("-date", "price", "-price", "year_of_release", "-likes_count"))}', None
+
+
+def _facets(rng, data):
+    if rng.random() < 0.5:
+        return 'GET', f'/cars/facets/?label={rng.choice(data["labels"])}&body_type={rng.choice(("s", "h", "u"))}', None
+    low = rng.randrange(100000, 4000000, 50000)
+    return 'GET', f'/cars/facets/?price__gte={low}&price__lte={low + 500000}', None
+
+
+def _top(rng, data):
+    return 'GET', f'/cars/top/?limit={rng.choice((10, 50, 100))}', None
+
+
+def _detail(rng, data):
+    return 'GET', f'/cars/{rng.choice(data["cars"])}/', None
+
+
+def _rate(rng, data):
+    body = {'like': rng.random() < 0.5, 'rate': rng.randint(1, 5)}
+    return 'PATCH', f'/cars_relation/{rng.choice(data["cars"])}/', body
+
+
+def _labels(rng, data):
+    return 'GET', '/labels/', None
+
+
+def _label(rng, data):
+    return 'GET', f'/labels/{rng.choice(data["labels"])}/', None
+
+
+# сценарий -> функция (rng, data) -> (method, path, body)
+SCENARIOS = {
+    'list': _list,
+    'search': _search,
+    'filter': _filter,
+    'ordering': _ordering,
+    'facets': _facets,
+    'top': _top,
+    'detail': _detail,
+    'rate': _rate,
+    'labels': _labels,
+    'label': _label,
+}
+
+
+def scenario_data(sample=1000, rng=None):
+    """Случайная выборка id объявлений и названий марок, к которым обращаются сценарии."""
+    rng = rng or random.Random(0)
+    cars = list(CarsModel.objects.order_by('?').values_list('id', flat=True)[:sample])
+    labels = list(LabelsModel.objects.values_list('name', flat=True))
+    if not cars or not labels:
+        raise ValueError('В базе нет объявлений или марок')
+    rng.shuffle(cars)
+    return {'cars': cars, 'labels': labels}
+
+
+class InProcessClient:
+    """Запросы через URLconf и middleware в этом же процессе, без сети."""
+
+    def __init__(self, user=None):
+        # адрес не из INTERNAL_IPS: debug toolbar не должен попадать в замеры
+        self.client = Client(REMOTE_ADDR='10.0.0.1', SERVER_NAME='localhost')
+        if user is not None:
+            self.client.force_login(user)
+
+    def request(self, method, path, body=None):
+        if body is None:
+            return self.client.generic(method, path).status_code
+        return self.client.generic(method, path, json.dumps(body), content_type='application/json').status_code
+
+
+class HttpClient:
+    """Запросы к запущенному серверу; сессия пользователя создается в его базе через force_login."""
+
+    def __init__(self, base_url, user=None):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {'Accept': 'application/json'}
+        if user is not None:
+            client = Client()
+            client.force_login(user)
+            csrf_token = get_random_string(32)
+            self.headers['Cookie'] = f'sessionid={client.cookies["sessionid"].value}; csrftoken={csrf_token}'
+            self.headers['X-CSRFToken'] = csrf_token
+
+    def request(self, method, path, body=None):
+        headers = dict(self.headers)
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+
+
+def percentile(timings, p):
+    if len(timings) == 1:
+        return timings[0]
+    return statistics.quantiles(timings, n=100, method='inclusive')[p - 1]
+
+
+def run_scenario(client, scenario, data, requests, warmup=0, concurrency=1, rng=None):
+    """
+    Прогоняет сценарий и возвращает задержки в миллисекундах и пропускную способность.
+
+    Параметры запросов выбираются заранее, чтобы генератор не попадал в замер;
+    ответы с кодом 400 и выше считаются ошибками.
+    """
+    rng = rng or random.Random(0)
+    make = SCENARIOS[scenario]
+    for _ in range(warmup):
+        client.request(*make(rng, data))
+    calls = [make(rng, data) for _ in range(requests)]
+
+    def timed(call):
+        started = time.perf_counter()
+        status = client.request(*call)
+        return (time.perf_counter() - started) * 1000, status
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(timed, calls))
+    else:
+        results = [timed(call) for call in calls]
+    elapsed = time.perf_counter() - started
+
+    timings = [timing for timing, _ in results]
+    return {
+        'requests': requests,
+        'errors': sum(status >= 400 for _, status in results),
+        'rps': requests / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.fmean(timings),
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+    }
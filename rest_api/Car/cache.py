@@ -0,0 +1,288 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from . import metrics
+from .models import CarsModel, LabelsModel, UserCarsRelation, car_is_deleting
+
+CACHE_PREFIX = 'cars'
+LABELS_PREFIX = 'labels'
+# версии карточек заводятся по числу объявлений, поэтому живут ограниченное время;
+# истекшая версия просто заменяется новой, и закэшированные под старой ответы больше не отдаются
+DETAIL_VERSION_TIMEOUT = 24 * 60 * 60
+
+
+def get_cache():
+    return caches[getattr(settings, 'CARS_CACHE_ALIAS', 'default')]
+
+
+def cache_is_shared():
+    """Видят ли все процессы один и тот же кэш: у LocMemCache он свой в каждом воркере, у DummyCache его нет."""
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def caching_enabled():
+    """
+    Можно ли кэшировать ответы и строить по версиям ETag.
+
+    Версия данных живет в кэше: с кэшем в памяти процесса запись в одном
+    воркере не сбросила бы ее в остальных и в командах, и они бесконечно
+    отдавали бы старые ответы и 304. Поэтому без общего кэша ответы
+    строятся заново; CARS_CACHE_ALLOW_LOCAL разрешает локальный кэш там,
+    где процесс один (runserver, тесты).
+    """
+    return cache_is_shared() or getattr(settings, 'CARS_CACHE_ALLOW_LOCAL', False)
+
+
+def _version_key(pk=None, prefix=CACHE_PREFIX):
+    return f'{prefix}:version' if pk is None else f'{prefix}:version:{pk}'
+
+
+def _new_version():
+    # версия, вытесненная из кэша, не должна совпасть со старой и оживить устаревшие ответы
+    return time.time_ns()
+
+
+def get_stamp(key, create=True, timeout=None):
+    """
+    Версия данных и время их последнего изменения (секунды) для ключа версии.
+
+    Отсутствующая версия создается со сроком timeout; без create вместо этого
+    возвращается None.
+    """
+    cache = get_cache()
+    modified_key = f'{key}:modified'
+    stamp = cache.get_many([key, modified_key])
+    if key not in stamp:
+        if not create:
+            return None
+        cache.add(key, _new_version(), timeout=timeout)
+        cache.add(modified_key, int(time.time()), timeout=timeout)
+        stamp = cache.get_many([key, modified_key])
+    return stamp.get(key, 0), stamp.get(modified_key, int(time.time()))
+
+
+def _bump(key, timeout=None):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), timeout=timeout)
+    cache.set(f'{key}:modified', int(time.time()), timeout=timeout)
+
+
+def invalidate(pk=None, labels=False):
+    """Сбрасывает закэшированные списки, карточку объявления pk и, если нужно, марки."""
+    _bump(_version_key())
+    if pk is not None:
+        _bump(_version_key(pk), timeout=DETAIL_VERSION_TIMEOUT)
+    if labels:
+        _bump(_version_key(prefix=LABELS_PREFIX))
+
+
+def _count(name):
+    cache = get_cache()
+    key = f'{CACHE_PREFIX}:stats:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cache_stats():
+    stats = get_cache().get_many([f'{CACHE_PREFIX}:stats:hits', f'{CACHE_PREFIX}:stats:misses'])
+    hits = stats.get(f'{CACHE_PREFIX}:stats:hits', 0)
+    misses = stats.get(f'{CACHE_PREFIX}:stats:misses', 0)
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / (hits + misses) if hits + misses else 0.0}
+
+
+def get_or_compute(name, signature, compute, timeout=None):
+    """
+    Значение, которое зависит от всех объявлений, из кэша или от compute().
+
+    Ключ включает общую версию списков, поэтому любое изменение объявлений
+    сбрасывает и его. Возвращает значение и признак попадания в кэш.
+    """
+    if not caching_enabled():
+        return compute(), False
+    cache = get_cache()
+    version, _ = get_stamp(_version_key())
+    key = f'{CACHE_PREFIX}:{name}:{version}:{signature}'
+    value = cache.get(key)
+    if value is not None:
+        _count('hits')
+        metrics.inc('cars_cache_requests_total', result='hit')
+        return value, True
+
+    _count('misses')
+    metrics.inc('cars_cache_requests_total', result='miss')
+    value = compute()
+    cache.set(key, value, timeout=getattr(settings, 'CARS_CACHE_TIMEOUT', 300) if timeout is None else timeout)
+    return value, False
+
+
+class VersionedViewMixin:
+    """
+    Общая часть кэша ответов и условных GET: версия данных, от которых зависит ответ.
+
+    Списки зависят от общей версии, карточка — только от версии своего объекта,
+    если versioned_detail включен.
+    """
+    version_prefix = CACHE_PREFIX
+    versioned_detail = True
+
+    def get_version_stamp(self):
+        """
+        Версия и время изменения данных ответа или None, если объекта из URL нет.
+
+        Версия карточки при чтении создается только для существующего объекта:
+        иначе каждый запрос /cars/<что угодно>/ оставлял бы в общем кэше ключи.
+        """
+        pk = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if pk is None or not self.versioned_detail:
+            return get_stamp(_version_key(prefix=self.version_prefix))
+        key = _version_key(pk, prefix=self.version_prefix)
+        stamp = get_stamp(key, create=False)
+        if stamp is None and self.object_exists(pk):
+            stamp = get_stamp(key, timeout=DETAIL_VERSION_TIMEOUT)
+        return stamp
+
+    def object_exists(self, pk):
+        manager = self.get_queryset().model._default_manager
+        try:
+            return manager.filter(**{self.lookup_field: pk}).exists()
+        except (TypeError, ValueError, DjangoValidationError):
+            return False
+
+    def get_request_digest(self, request):
+        query = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+        return hashlib.md5(f'{request.get_host()}{query}'.encode()).hexdigest()
+
+
+class CachedResponseMixin(VersionedViewMixin):
+    """
+    Кэширует ответы list и retrieve для анонимных пользователей.
+
+    Ключ строится из версии данных, хоста и нормализованной строки запроса
+    (фильтры, поиск, сортировка, курсор). Изменения моделей увеличивают версию,
+    поэтому инвалидация — это один incr, а не поиск и удаление ключей.
+    """
+    # None — CARS_CACHE_TIMEOUT, читается при каждой записи, а не при импорте модуля
+    cache_timeout = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_cache_key(self, request):
+        stamp = self.get_version_stamp()
+        if stamp is None:
+            return None
+        version, _ = stamp
+        pk = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        return f'{self.version_prefix}:{self.action}:{pk}:{version}:{self.get_request_digest(request)}'
+
+    def get_cache_timeout(self):
+        if self.cache_timeout is None:
+            return getattr(settings, 'CARS_CACHE_TIMEOUT', 300)
+        return self.cache_timeout
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated or not caching_enabled():
+            return handler(request, *args, **kwargs)
+
+        key = self.get_cache_key(request)
+        if key is None:
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        data = cache.get(key)
+        if data is not None:
+            _count('hits')
+            metrics.inc('cars_cache_requests_total', result='hit')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        _count('misses')
+        metrics.inc('cars_cache_requests_total', result='miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout=self.get_cache_timeout())
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class ConditionalGetMixin(VersionedViewMixin):
+    """
+    ETag и Last-Modified для list и retrieve без рендера тела.
+
+    Валидаторы берутся из версии данных в кэше, поэтому неизмененный опрос
+    получает 304 без основного запроса к базе и без сериализатора. Без
+    общего кэша (caching_enabled) валидаторы не отдаются.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def get_validators(self, request):
+        stamp = self.get_version_stamp()
+        if stamp is None:
+            return None, None
+        version, modified = stamp
+        digest = self.get_request_digest(request)
+        return f'W/"{version}-{request.accepted_renderer.format}-{digest[:12]}"', modified
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if not caching_enabled():
+            return handler(request, *args, **kwargs)
+        etag, last_modified = self.get_validators(request)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+def invalidate_on_commit(pk=None, labels=False):
+    # сбрасываем сразу и еще раз после коммита: пока транзакция не завершена, параллельный
+    # запрос видит старые данные и мог бы закэшировать их под уже увеличенной версией
+    invalidate(pk, labels)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: invalidate(pk, labels))
+
+
+@receiver([post_save, post_delete], sender=CarsModel)
+def invalidate_car(sender, instance, **kwargs):
+    invalidate_on_commit(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserCarsRelation)
+def invalidate_relation(sender, instance, **kwargs):
+    # удаляемое объявление сбросит свою версию само, один раз, а не на каждое отношение
+    if not car_is_deleting(instance.car_id):
+        invalidate_on_commit(instance.car_id)
+
+
+@receiver([post_save, post_delete], sender=LabelsModel)
+def invalidate_label(sender, instance, **kwargs):
+    invalidate_on_commit(labels=True)
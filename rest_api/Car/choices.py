@@ -0,0 +1,52 @@
+import datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import models
+
+YEAR_MIN = 1950
+ENGINE_CAPACITY_MIN = Decimal('0.5')
+ENGINE_CAPACITY_MAX = Decimal('6.0')
+ENGINE_CAPACITY_DEFAULT = Decimal('1.5')
+
+
+class EngineType(models.TextChoices):
+    PETROL = 'p', 'Бензиновый'
+    DIESEL = 'd', 'Дизельный'
+
+
+class TransmissionType(models.TextChoices):
+    MANUAL = 'm', 'Механическая'
+    AUTOMATIC = 'a', 'Автоматическая'
+    ROBOTIC = 'r', 'Роботизированная'
+
+
+class DriveType(models.TextChoices):
+    FRONT = 'f', 'Передний'
+    REAR = 'r', 'Задний'
+    ALL = 'a', 'Полный'
+
+
+class BodyType(models.TextChoices):
+    HATCHBACK = 'h', 'Хэтбек'
+    SEDAN = 's', 'Седан'
+    WAGON = 'u', 'Универсал'
+    CABRIOLET = 'k', 'Кабриолет'
+
+
+def current_year():
+    """Год по умолчанию для объявления; ссылкой на функцию он не попадает в миграции."""
+    return datetime.date.today().year
+
+
+def validate_year(value):
+    # граница вычисляется при проверке, поэтому смена года не требует новой миграции
+    if not YEAR_MIN <= value <= current_year():
+        raise ValidationError(f'Год выпуска должен быть от {YEAR_MIN} до {current_year()}', code='year')
+
+
+def validate_engine_capacity(value):
+    if not ENGINE_CAPACITY_MIN <= value <= ENGINE_CAPACITY_MAX:
+        raise ValidationError(
+            f'Объем двигателя должен быть от {ENGINE_CAPACITY_MIN} до {ENGINE_CAPACITY_MAX} л', code='engine_capacity')
+
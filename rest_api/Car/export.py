@@ -0,0 +1,40 @@
+from django.db.models import prefetch_related_objects
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def _chunks(queryset, chunk_size):
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_serialized(queryset, serializer_class, chunk_size=1000, ndjson=False, context=None):
+    """
+    Отдает сериализованный queryset по частям: JSON-массивом или NDJSON.
+
+    Строки читаются серверным курсором, prefetch_related выполняется отдельно
+    для каждой пачки, поэтому в памяти держится не больше chunk_size объектов.
+    """
+    lookups = queryset._prefetch_related_lookups
+    queryset = queryset.prefetch_related(None)
+    encoder = JSONEncoder(ensure_ascii=False)
+
+    if not ndjson:
+        yield '['
+    first = True
+    for chunk in _chunks(queryset, chunk_size):
+        if lookups:
+            prefetch_related_objects(chunk, *lookups)
+        data = serializer_class(chunk, many=True, context=context).data
+        if ndjson:
+            yield ''.join(encoder.encode(item) + '\n' for item in data)
+        else:
+            yield ('' if first else ',') + ','.join(encoder.encode(item) for item in data)
+        first = False
+    if not ndjson:
+        yield ']'
@@ -0,0 +1,114 @@
+import hashlib
+import json
+
+from django.db import connections
+from django.db.models import BooleanField, ExpressionWrapper, F, Q, Value
+from django_filters.constants import EMPTY_VALUES
+
+from .choices import BodyType, DriveType, TransmissionType
+from .filters import filter_condition
+from .models import CarsFacetCount, CarsModel
+
+YEAR_BUCKET = 5
+
+# фасет -> (значение строки, параметры фильтра, которые он заменяет, названия значений)
+FACETS = {
+    'label': (F('label_id'), ('label',), None),
+    'body_type': (F('body_type'), ('body_type',), dict(BodyType.choices)),
+    'drive_type': (F('drive_type'), ('drive_type',), dict(DriveType.choices)),
+    'transmission_type': (F('transmission_type'), ('transmission_type',), dict(TransmissionType.choices)),
+    'year': (F('year_of_release') - F('year_of_release') % YEAR_BUCKET,
+             ('year_of_release__gte', 'year_of_release__lte'), None),
+}
+
+
+def facets_signature(filterset, search_params):
+    """Ключ набора фильтров: порядок параметров, сортировка и курсор на счетчики не влияют."""
+    data = {name: sorted(set(value)) if isinstance(value, list) else str(value)
+            for name, value in filterset.form.cleaned_data.items() if value not in EMPTY_VALUES}
+    data.update(search_params)
+    return hashlib.md5(json.dumps(data, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def _match(conditions):
+    condition = Q()
+    for other in conditions:
+        condition &= other
+    return ExpressionWrapper(condition, output_field=BooleanField()) if condition else Value(True)
+
+
+def facet_counts(filterset, queryset=None):
+    """
+    Счетчики по марке, кузову, приводу, КПП и пятилетиям года выпуска одним запросом.
+
+    Фасет считается без собственного фильтра, но с фильтрами остальных
+    фасетов, чтобы рядом с выбранной маркой были видны и другие: каждое такое
+    условие вычисляется флагом строки и проверяется в FILTER (WHERE ...), а
+    все фасеты группируются за один проход через GROUPING SETS. Значения,
+    которых при остальных фильтрах нет, в ответ не попадают.
+
+    queryset — объявления после полнотекстового поиска, None — поиска нет.
+    Если кроме фасетов ничего не задано, строки берутся из CarsFacetCount,
+    а не из всей таблицы объявлений; иначе остальные фильтры ограничивают
+    объявления в WHERE.
+    """
+    data = filterset.form.cleaned_data
+    facet_params = {param for _, params, _ in FACETS.values() for param in params}
+    other_params = [name for name, value in data.items() if name not in facet_params and value not in EMPTY_VALUES]
+    if queryset is None and not other_params:
+        queryset, weight = CarsFacetCount.objects.all(), F('cars_count')
+    else:
+        queryset, weight = CarsModel.objects.all() if queryset is None else queryset, Value(1)
+        for name in other_params:
+            queryset = filterset.filters[name].filter(queryset, data[name])
+
+    conditions = {facet: [filter_condition(filterset.filters[param], data.get(param)) for param in params]
+                  for facet, (_, params, _) in FACETS.items()}
+    annotations = {'weight': weight}
+    for number, (facet, (value, _, _)) in enumerate(FACETS.items()):
+        others = [condition for other, items in conditions.items() if other != facet for condition in items]
+        annotations[f'facet_{number}'] = value
+        annotations[f'match_{number}'] = _match(others)
+    annotations['match_all'] = _match(condition for items in conditions.values() for condition in items)
+
+    queryset = queryset.order_by().annotate(**annotations).values(*annotations)
+    inner, params = queryset.query.sql_with_params()
+    columns = [f'facet_{number}' for number in range(len(FACETS))]
+    sums = [f'coalesce(sum(weight) FILTER (WHERE {match}), 0)'
+            for match in [f'match_{number}' for number in range(len(FACETS))] + ['match_all']]
+    sql = f'SELECT GROUPING({", ".join(columns)}), {", ".join(columns)}, {", ".join(sums)} ' \
+          f'FROM ({inner}) facets GROUP BY GROUPING SETS ({", ".join(f"({column})" for column in columns)}, ())'
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    # GROUPING() ставит бит каждой колонке, по которой строка не сгруппирована; первая — старший бит
+    full = (1 << len(FACETS)) - 1
+    grouped = {full ^ (1 << (len(FACETS) - 1 - number)): number for number in range(len(FACETS))}
+    result = {'count': 0, **{facet: [] for facet in FACETS}}
+    names = list(FACETS)
+    for row in rows:
+        mask, values, counts = row[0], row[1:1 + len(FACETS)], row[1 + len(FACETS):]
+        if mask == full:
+            result['count'] = counts[-1]
+            continue
+        number = grouped[mask]
+        count = counts[number]
+        if count:
+            result[names[number]].append(_facet_value(names[number], values[number], count))
+
+    for facet, items in result.items():
+        if facet == 'year':
+            items.sort(key=lambda item: item['from'], reverse=True)
+        elif facet != 'count':
+            items.sort(key=lambda item: (-item['count'], item['value']))
+    return result
+
+
+def _facet_value(facet, value, count):
+    if facet == 'year':
+        return {'from': value, 'to': value + YEAR_BUCKET - 1, 'count': count}
+    names = FACETS[facet][2]
+    if names is None:
+        return {'value': value, 'count': count}
+    return {'value': value, 'name': names.get(value, value), 'count': count}
@@ -0,0 +1,75 @@
+from django import forms
+from django.db.models import Q
+from django_filters import rest_framework as filters
+from django_filters.constants import EMPTY_VALUES
+
+from .choices import BodyType, DriveType, EngineType, TransmissionType
+from .models import CarsModel
+
+
+class MultipleValueFilter(filters.MultipleChoiceFilter):
+    """
+    Несколько значений одного поля: ?engine_type=p&engine_type=d.
+
+    Выбранные значения сравниваются одним IN, который Postgres проверяет
+    по индексу как массив, а не цепочкой OR. DISTINCT не нужен: поле
+    лежит в самой таблице объявлений, а не в связи ко многим.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('distinct', False)
+        super().__init__(*args, **kwargs)
+
+    def get_condition(self, value):
+        return Q(**{f'{self.field_name}__in': sorted(set(value))})
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        return self.get_method(qs)(self.get_condition(value))
+
+
+class MultipleCharField(forms.MultipleChoiceField):
+    # любое значение допустимо: неизвестная марка дает пустой список без запроса к таблице марок
+    def valid_value(self, value):
+        return True
+
+
+class MultipleCharFilter(MultipleValueFilter):
+    field_class = MultipleCharField
+
+
+def filter_condition(filter, value):
+    """Условие фильтра в виде Q, чтобы проверить его внутри выражения, а не в WHERE."""
+    if value in EMPTY_VALUES:
+        return Q()
+    if isinstance(filter, MultipleValueFilter):
+        return filter.get_condition(value)
+    return Q(**{f'{filter.field_name}__{filter.lookup_expr}': value})
+
+
+class CarsFilter(filters.FilterSet):
+    """
+    Фильтры списка объявлений.
+
+    Диапазоны цены, года и объема двигателя (price__gte, price__lte, ...),
+    минимальный рейтинг (rating__gte) и несколько значений марки и типов
+    двигателя, КПП, привода и кузова. Каждое условие обслуживается индексом
+    (поле, id) из CarsModel.Meta.indexes, поэтому его можно совмещать с
+    постраничным выводом по ключу.
+    """
+    label = MultipleCharFilter()
+    engine_type = MultipleValueFilter(choices=EngineType.choices)
+    transmission_type = MultipleValueFilter(choices=TransmissionType.choices)
+    drive_type = MultipleValueFilter(choices=DriveType.choices)
+    body_type = MultipleValueFilter(choices=BodyType.choices)
+
+    class Meta:
+        model = CarsModel
+        fields = {
+            'price': ['exact', 'gte', 'lte'],
+            'year_of_release': ['gte', 'lte'],
+            'engine_capacity': ['gte', 'lte'],
+            'rating': ['gte'],
+            'likes_count': ['exact', 'gte'],
+        }
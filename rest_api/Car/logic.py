@@ -1,9 +1,251 @@
-from django.db.models import Avg
+from collections import Counter
 
-from .models import UserCarsRelation
+from django.db import connection, connections, transaction
+from django.db.models import Avg, Count, DecimalField, F, OuterRef, Subquery, Sum, IntegerField
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from . import metrics
+from .models import CarsFacetCount, CarsModel, CarsTopListing, UserCarsRelation
+
+
+def _relations_subquery(aggregate, output_field, **filters):
+    relations = UserCarsRelation.objects.filter(car=OuterRef('pk'), **filters)\
+        .order_by().values('car').annotate(value=aggregate).values('value')
+    return Subquery(relations, output_field=output_field)
+
+
+def rebuild_ratings(queryset=None):
+    """Пересчитывает rating_sum, rating_count и rating с нуля одним UPDATE."""
+    if queryset is None:
+        queryset = CarsModel.objects.all()
+    return queryset.update(
+        rating_sum=Coalesce(_relations_subquery(Sum('rate'), IntegerField(), rate__isnull=False), 0),
+        rating_count=Coalesce(_relations_subquery(Count('rate'), IntegerField(), rate__isnull=False), 0),
+        rating=_relations_subquery(Avg('rate'), DecimalField(max_digits=3, decimal_places=2), rate__isnull=False),
+    )
+
+
+def rebuild_likes(queryset=None):
+    """Пересчитывает likes_count и customers_count с нуля одним UPDATE."""
+    if queryset is None:
+        queryset = CarsModel.objects.all()
+    return queryset.update(
+        likes_count=Coalesce(_relations_subquery(Count('pk'), IntegerField(), like=True), 0),
+        customers_count=Coalesce(_relations_subquery(Count('pk'), IntegerField()), 0),
+    )
+
+
+def update_counters(car_id, rate_delta=0, count_delta=0, likes_delta=0, customers_delta=0):
+    """Атомарно сдвигает счетчики объявления и выводит из них rating."""
+    fields = {}
+    if rate_delta or count_delta:
+        rating_sum = F('rating_sum') + rate_delta
+        rating_count = F('rating_count') + count_delta
+        fields.update(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            rating=Cast(rating_sum, DecimalField(max_digits=12, decimal_places=2)) / NullIf(rating_count, 0),
+        )
+    if likes_delta:
+        fields['likes_count'] = F('likes_count') + likes_delta
+    if customers_delta:
+        fields['customers_count'] = F('customers_count') + customers_delta
+    if fields:
+        metrics.inc('cars_rating_updates_total', kind='delta')
+        with metrics.timer('cars_rating_update_duration_seconds', kind='delta'):
+            CarsModel.objects.filter(pk=car_id).update(**fields)
 
 
 def set_rating(car):
-    rating = UserCarsRelation.objects.filter(car=car).aggregate(rating=Avg('rate'))['rating']
-    car.rating = rating
-    car.save()
\ No newline at end of file
+    metrics.inc('cars_rating_updates_total', kind='set_rating')
+    with metrics.timer('cars_rating_update_duration_seconds', kind='set_rating'):
+        rebuild_ratings(CarsModel.objects.filter(pk=car.pk))
+    car.refresh_from_db(fields=['rating_sum', 'rating_count', 'rating'])
+
+
+def upsert_relations(relations, batch_size=1000):
+    """
+    Записывает кортежи (user_id, car_id, like, rate) через INSERT ... ON CONFLICT
+    и пересчитывает счетчики один раз на каждое затронутое объявление.
+
+    Кортеж — полное состояние отношения; из повторов одной пары остается
+    последний. Возвращает множество id затронутых объявлений.
+    """
+    latest = {}
+    for user_id, car_id, like, rate in relations:
+        latest[user_id, car_id] = (bool(like), rate)
+    if not latest:
+        return set()
+
+    opts = UserCarsRelation._meta
+    table, user, car, like, rate = (connection.ops.quote_name(name) for name in (
+        opts.db_table, opts.get_field('user').column, opts.get_field('car').column,
+        opts.get_field('like').column, opts.get_field('rate').column))
+    rows = [(user_id, car_id, like_value, rate_value) for (user_id, car_id), (like_value, rate_value) in latest.items()]
+
+    # bulk_create(update_conflicts=True) появился только в Django 4.1
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {car}, {like}, {rate}) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT ({user}, {car}) DO UPDATE SET {like} = EXCLUDED.{like}, {rate} = EXCLUDED.{rate}',
+                [value for row in batch for value in row])
+
+        car_ids = {car_id for _, car_id in latest}
+        cars = CarsModel.objects.filter(pk__in=car_ids)
+        rebuild_ratings(cars)
+        rebuild_likes(cars)
+    return car_ids
+
+
+def update_facet_counts(deltas):
+    """
+    Сдвигает CarsFacetCount на {ключ фасетов: смещение} одним INSERT ... ON CONFLICT.
+
+    Ключ — CarsModel.facet_key(). Ключи упорядочены, чтобы параллельные
+    запросы блокировали строки счетчиков в одном порядке и не попадали
+    во взаимную блокировку.
+    """
+    rows = sorted((key, delta) for key, delta in deltas.items() if delta)
+    if not rows:
+        return
+    opts = CarsFacetCount._meta
+    table, count = connection.ops.quote_name(opts.db_table), connection.ops.quote_name('cars_count')
+    columns = [connection.ops.quote_name(opts.get_field(name).column)
+               for name in ('label', 'body_type', 'drive_type', 'transmission_type', 'year_of_release')]
+    placeholders = ', '.join(['%s'] * (len(columns) + 1))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(columns)}, {count}) '
+            f'VALUES {", ".join([f"({placeholders})"] * len(rows))} '
+            f'ON CONFLICT ({", ".join(columns)}) DO UPDATE SET {count} = {table}.{count} + EXCLUDED.{count}',
+            [value for key, delta in rows for value in (*key, delta)])
+
+
+def _array_literal(values):
+    # массив одной строкой '{...}': сервер разбирает ее целиком, а не тысячи отдельных констант ARRAY[...]
+    items = ('NULL' if value is None else '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+             for value in values)
+    return '{' + ','.join(items) + '}'
+
+
+def insert_cars(rows, owner, batch_size=1000):
+    """
+    Вставляет объявления из проверенных данных сериализатора и возвращает их id по порядку.
+
+    Вместо bulk_create каждая пачка — один INSERT ... SELECT из unnest()
+    массивов по колонкам: SQL не собирается построчно, колонки с одинаковым
+    во всей пачке значением (дата, владелец, нулевые счетчики) передаются
+    одним параметром, а search_vector считается в том же INSERT, без второй
+    записи каждой строки отдельным UPDATE. Счетчики фасетов сдвигаются на
+    всю пачку сразу; post_save не вызывается, кэш сбрасывает вызывающий.
+    """
+    from .search import cars_search_vector
+
+    opts = CarsModel._meta
+    fields = [field for field in opts.concrete_fields if not field.primary_key and field.name != 'search_vector']
+    quote = connection.ops.quote_name
+    table = quote(opts.db_table)
+    # подзапрос назван как таблица и отдает ее колонки, поэтому выражение search_vector,
+    # скомпилированное для CarsModel, ссылается прямо на них
+    query = CarsModel.objects.all().query
+    vector, vector_params = query.get_compiler(connection=connection).compile(
+        cars_search_vector().resolve_expression(query))
+    columns = ', '.join(quote(field.column) for field in fields)
+
+    facet_names = [opts.get_field(name).name for name in CarsModel.facet_fields]
+    defaults = {field.name: field.get_default() for field in fields}
+    defaults.update(date=timezone.now(), owner=owner)
+    db = connections[CarsModel.objects.db]
+    ids = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = [{**defaults, **row} for row in rows[start:start + batch_size]]
+            select, constants, arrays, unnested = [], [], [], []
+            for field in fields:
+                values = [row[field.name] for row in batch]
+                if field.is_relation:
+                    values = [getattr(value, 'pk', value) for value in values]
+                column, db_type = quote(field.column), field.cast_db_type(connection)
+                if all(value == values[0] for value in values):
+                    select.append(f'%s::{db_type} AS {column}')
+                    constants.append(field.get_db_prep_save(values[0], db))
+                else:
+                    select.append(column)
+                    arrays.append(_array_literal(field.get_db_prep_save(value, db) for value in values))
+                    unnested.append((column, db_type))
+            if unnested:
+                source = f'unnest({", ".join(f"%s::{t}[]" for _, t in unnested)}) ' \
+                         f'AS rows ({", ".join(c for c, _ in unnested)})'
+            else:
+                # все строки пачки одинаковы
+                source, arrays = 'generate_series(1, %s)', [len(batch)]
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}, {quote("search_vector")}) SELECT {columns}, {vector} '
+                f'FROM (SELECT {", ".join(select)} FROM {source}) AS {table} RETURNING {quote("id")}',
+                [*vector_params, *constants, *arrays])
+            ids += [row[0] for row in cursor.fetchall()]
+            update_facet_counts(Counter(tuple(getattr(row[name], 'pk', row[name]) for name in facet_names)
+                                        for row in batch))
+    return ids
+
+
+def rebuild_facets():
+    """Пересчитывает CarsFacetCount с нуля по всем объявлениям и возвращает число строк."""
+    opts = CarsFacetCount._meta
+    table = connection.ops.quote_name(opts.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # смещения, записанные другими запросами во время пересчета, иначе потерялись бы вместе со старыми строками
+        cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+        CarsFacetCount.objects.all().delete()
+        cars = CarsModel.objects.order_by().values(*CarsModel.facet_fields).annotate(cars_count=Count('pk'))
+        CarsFacetCount.objects.bulk_create((CarsFacetCount(**row) for row in cars.iterator()), batch_size=10000)
+        return CarsFacetCount.objects.count()
+
+
+def refresh_top_listings():
+    """
+    Пересобирает рейтинг CarsTopListing и возвращает число строк в нем.
+
+    CONCURRENTLY сравнивает новый результат со старым по уникальному индексу
+    и не блокирует чтение: /cars/top/ до конца обновления видит прежний рейтинг.
+    """
+    table = connection.ops.quote_name(CarsTopListing._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {table}')
+    return CarsTopListing.objects.count()
+
+
+def top_cars(limit):
+    """Первые limit объявлений рейтинга; удаленные после обновления объявления пропускаются."""
+    return CarsModel.objects.filter(top_listing__isnull=False).order_by('top_listing__position')[:limit]
+
+
+def customers_preview(car_ids, limit):
+    """
+    Первые limit оценивших для каждого объявления: {car_id: [{first_name, last_name}]}.
+
+    Одним запросом на всю страницу: для каждого объявления подзапрос берет
+    limit первых отношений по индексу (car, id), так что объем не зависит
+    от того, сколько всего пользователей оценили объявление.
+    """
+    previews = {car_id: [] for car_id in car_ids}
+    if not previews:
+        return previews
+    first_relations = UserCarsRelation.objects.filter(car=OuterRef('car')).order_by('id').values('id')[:limit]
+    rows = UserCarsRelation.objects.filter(car__in=previews, id__in=Subquery(first_relations))\
+        .order_by('car', 'id').values_list('car', 'user__first_name', 'user__last_name')
+    for car_id, first_name, last_name in rows:
+        previews[car_id].append({'first_name': first_name, 'last_name': last_name})
+    return previews
+
+
+def attach_customers_preview(cars, limit):
+    """Проставляет объявлениям car.customers_preview, если его еще нет."""
+    cars = [car for car in cars if not hasattr(car, 'customers_preview')]
+    previews = customers_preview([car.pk for car in cars], limit)
+    for car in cars:
+        car.customers_preview = previews[car.pk]
@@ -0,0 +1,68 @@
+import csv
+import json
+import sys
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Car.cache import invalidate
+from Car.logic import upsert_relations
+from Car.serializers import validate_relation_rows
+
+
+class Command(BaseCommand):
+    help = 'Применяет лайки и оценки (user, car, like, rate) из NDJSON или CSV пачками ' \
+           'и пересчитывает рейтинг один раз на объявление в каждой пачке'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл с отношениями, "-" — стандартный ввод')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='Формат файла; по умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+        try:
+            rows = self.read_csv(stream) if file_format == 'csv' else self.read_ndjson(stream)
+            self.apply(rows, options['batch_size'])
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def read_ndjson(self, stream):
+        for number, line in enumerate(stream):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as exc:
+                raise CommandError(f'Строка {number + 1}: {exc}')
+
+    def read_csv(self, stream):
+        for row in csv.DictReader(stream):
+            if 'like' in row:
+                row['like'] = row['like'].strip().lower() in ('1', 'true', 't', 'yes')
+            if not row.get('rate'):
+                row['rate'] = None
+            yield row
+
+    def apply(self, rows, batch_size):
+        applied, failed, cars, start = 0, 0, set(), 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            relations, errors = validate_relation_rows(batch, start=start)
+            car_ids = upsert_relations(relations)
+            for car_id in car_ids:
+                invalidate(car_id)
+
+            for error in errors:
+                self.stdout.write(f'{error["row"]}: {json.dumps(error["errors"], ensure_ascii=False)}')
+            applied, failed, start = applied + len(relations), failed + len(errors), start + len(batch)
+            cars |= car_ids
+
+        self.stdout.write(f'Применено отношений: {applied}, с ошибками: {failed}, объявлений: {len(cars)}')
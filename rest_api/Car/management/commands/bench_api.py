@@ -0,0 +1,110 @@
+import datetime
+import json
+import random
+import subprocess
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from Car.benchmark import HttpClient, InProcessClient, SCENARIOS, run_scenario, scenario_data
+from Car.cache import get_cache
+from Car.models import CarsModel, UserCarsRelation
+from Car.seed import seed_cars, seed_relations, seed_users
+
+from .bench_pagination import Rollback
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный замер API: p50/p95/p99 и запросы в секунду по сценариям. ' \
+           'Без --url запросы идут через URLconf в этом процессе, а данные создаются в транзакции ' \
+           'и откатываются; с --url — к запущенному серверу, и созданные данные остаются в базе.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=int, default=10000, help='Сколько объявлений добавить')
+        parser.add_argument('--users', type=int, default=1000, help='Сколько пользователей добавить')
+        parser.add_argument('--relations-per-car', type=int, default=5)
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help='Сценарии через запятую: ' + ', '.join(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--url', help='Адрес запущенного сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=1, help='Параллельных запросов (только с --url)')
+        parser.add_argument('--authenticated', action='store_true',
+                            help='Читать от имени пользователя: ответы не берутся из кэша анонимов')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'].split(',')
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        if options['concurrency'] > 1 and not options['url']:
+            raise CommandError('--concurrency работает только с --url: '
+                               'в этом процессе данные видны лишь одному соединению')
+
+        if options['url']:
+            results = self.run(scenarios, options)
+        else:
+            try:
+                with transaction.atomic():
+                    results = self.run(scenarios, options)
+                    raise Rollback
+            except Rollback:
+                pass
+        self.report(results, options)
+
+    def run(self, scenarios, options):
+        self.seed(options)
+        user = User.objects.get_or_create(username='bench_api')[0]
+        reader = user if options['authenticated'] else None
+        if options['url']:
+            clients = {False: HttpClient(options['url'], reader), True: HttpClient(options['url'], user)}
+        else:
+            clients = {False: InProcessClient(reader), True: InProcessClient(user)}
+
+        data = scenario_data()
+        self.stdout.write(f'{"scenario":>9} {"rps":>8} {"p50, ms":>8} {"p95, ms":>8} {"p99, ms":>8} {"errors":>7}')
+        results = {}
+        for name in scenarios:
+            writes = SCENARIOS[name](random.Random(0), data)[0] != 'GET'
+            get_cache().clear()
+            results[name] = run_scenario(clients[writes], name, data, options['requests'],
+                                         warmup=options['warmup'], concurrency=options['concurrency'])
+            self.stdout.write(self.format_row(name, results[name]))
+        return results
+
+    def seed(self, options):
+        car_ids = seed_cars(options['cars'])
+        user_ids = seed_users(options['users'])
+        if car_ids and user_ids and options['relations_per_car']:
+            seed_relations(car_ids, user_ids, options['relations_per_car'])
+        with connection.cursor() as cursor:
+            for model in (CarsModel, UserCarsRelation):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    def format_row(self, name, result):
+        return f'{name:>9} {result["rps"]:>8.1f} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} ' \
+               f'{result["p99_ms"]:>8.2f} {result["errors"]:>7}'
+
+    def report(self, results, options):
+        if not options['output']:
+            return
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                    check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        payload = {
+            'commit': commit,
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'target': options['url'] or 'in-process',
+            'scale': {key: options[key] for key in ('cars', 'users', 'relations_per_car')},
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'authenticated': options['authenticated'],
+            'scenarios': results,
+        }
+        with open(options['output'], 'w') as file:
+            json.dump(payload, file, indent=2)
+        self.stdout.write(f'Результаты записаны в {options["output"]}')
@@ -0,0 +1,70 @@
+import json
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from Car.choices import BodyType, DriveType, EngineType, TransmissionType
+from Car.models import LabelsModel
+from Car.seed import SEED_CAPACITIES, SEED_LABELS, SEED_MODELS
+from Car.views import CarsAPIViewSet
+
+from .bench_pagination import Rollback
+
+TARGET_ROWS_PER_SECOND = 10000
+
+
+class Command(BaseCommand):
+    help = 'Замеряет скорость POST /cars/bulk/ (строк в секунду) на 1k и 10k объявлений и сравнивает ее ' \
+           f'с целью {TARGET_ROWS_PER_SECOND} строк/с. Данные создаются в транзакции и откатываются.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                # внешние ключи проверяются при коммите, которого при откате нет: проверяем их сразу
+                with connection.cursor() as cursor:
+                    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+                self.run(sorted(options['rows']))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes):
+        for name in SEED_LABELS:
+            LabelsModel.objects.get_or_create(name=name)
+        user = User.objects.create(username='bench_bulk')
+        view = CarsAPIViewSet.as_view({'post': 'bulk'})
+        factory = APIRequestFactory()
+
+        self.stdout.write(f'{"rows":>7} {"rows/s":>9} {"target":>9} {"gap":>7}')
+        for size in sizes:
+            body = json.dumps(self.rows(size))
+            best = None
+            for _ in range(self.repeat):
+                request = factory.post('/cars/bulk/', body, content_type='application/json')
+                force_authenticate(request, user)
+                started = time.perf_counter()
+                response = view(request)
+                elapsed = time.perf_counter() - started
+                assert response.data['created'] == size, response.data['errors'][:5]
+                best = elapsed if best is None else min(best, elapsed)
+            rate = size / best
+            gap = max(0.0, 1 - rate / TARGET_ROWS_PER_SECOND)
+            self.stdout.write(f'{size:>7} {rate:>9.0f} {TARGET_ROWS_PER_SECOND:>9} {gap:>7.0%}')
+
+    def rows(self, size):
+        rng = random.Random(0)
+        return [{'label': rng.choice(SEED_LABELS), 'model': rng.choice(SEED_MODELS),
+                 'year_of_release': rng.randint(1990, 2021), 'price': rng.randrange(100000, 5000000, 50000),
+                 'description': f'Пробег {rng.randint(1000, 300000)} км, один владелец',
+                 'engine_type': rng.choice(EngineType.values), 'engine_capacity': str(rng.choice(SEED_CAPACITIES)),
+                 'transmission_type': rng.choice(TransmissionType.values), 'drive_type': rng.choice(DriveType.values),
+                 'body_type': rng.choice(BodyType.values)} for _ in range(size)]
@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.utils import load_backend
+
+from rest_api.db import check_connection
+from rest_api.db.pooled.base import DatabaseWrapper as PooledDatabaseWrapper
+
+# режим -> (ENGINE, CONN_MAX_AGE, CONN_HEALTH_CHECKS)
+MODES = {
+    'new': ('django.db.backends.postgresql', 0, False),
+    'persistent': ('django.db.backends.postgresql', 600, False),
+    'persistent+health': ('django.db.backends.postgresql', 600, True),
+    'pool': ('rest_api.db.pooled', 0, True),
+}
+
+
+def make_connection(engine, max_age, health_checks):
+    """Отдельное соединение с той же базой, что и default, но с другими настройками постоянства."""
+    settings_dict = {**connection.settings_dict, 'ENGINE': engine, 'CONN_MAX_AGE': max_age,
+                     'CONN_HEALTH_CHECKS': health_checks, 'OPTIONS': dict(connection.settings_dict['OPTIONS'])}
+    # псевдоним default: сигнал contrib.postgres ищет соединение по нему, чтобы узнать oid hstore
+    return load_backend(engine).DatabaseWrapper(settings_dict, DEFAULT_DB_ALIAS)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает стоимость запроса с новым соединением, постоянным соединением ' \
+           '(с проверкой и без) и пулом: цикл request_started — SELECT — request_finished.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--queries', type=int, default=1, help='SQL-запросов на один HTTP-запрос')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"mode":>18} {"p50, ms":>8} {"p95, ms":>8} {"saved, ms":>10}')
+        baseline = None
+        for mode, (engine, max_age, health_checks) in MODES.items():
+            wrapper = make_connection(engine, max_age, health_checks)
+            try:
+                timings = self.measure(wrapper, options['requests'], options['queries'])
+            finally:
+                wrapper.close()
+            p50 = statistics.median(timings)
+            p95 = statistics.quantiles(timings, n=20)[18]
+            baseline = p50 if baseline is None else baseline
+            self.stdout.write(f'{mode:>18} {p50:>8.3f} {p95:>8.3f} {baseline - p50:>10.3f}')
+        PooledDatabaseWrapper.close_pools()
+
+    def measure(self, wrapper, requests, queries):
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            # то же, что делают сигналы request_started и request_finished для каждого соединения
+            wrapper.close_if_unusable_or_obsolete()
+            check_connection(wrapper)
+            with wrapper.cursor() as cursor:
+                for _ in range(queries):
+                    cursor.execute('SELECT 1')
+            wrapper.close_if_unusable_or_obsolete()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
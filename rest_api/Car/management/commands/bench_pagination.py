@@ -0,0 +1,85 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory
+
+from Car.models import CarsModel
+from Car.pagination import KeysetPagination
+from Car.seed import seed_cars
+from Car.views import CarsAPIViewSet
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время страницы /cars/ на разной глубине при 10k, 100k и 1M объявлений. ' \
+           'Данные создаются в транзакции и откатываются.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--ordering', default='date,-date,price,-price',
+                            help='Поля сортировки через запятую')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        self.view = CarsAPIViewSet.as_view({'get': 'list'})
+        self.repeat = options['repeat']
+
+        try:
+            with transaction.atomic():
+                self.run(sorted(options['rows']), options['ordering'].split(','))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, orderings):
+        self.stdout.write(f'{"rows":>9} {"ordering":>8} {"depth":>6} {"keyset, ms":>11} {"offset, ms":>11}')
+        seeded = CarsModel.objects.count()
+        for size in sizes:
+            if size > seeded:
+                seed_cars(size - seeded)
+                seeded = size
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(CarsModel._meta.db_table)}')
+
+            for ordering in orderings:
+                for depth in (0, 0.5, 0.99):
+                    position = int(seeded * depth)
+                    keyset = self.measure(self.keyset_url(ordering, position))
+                    offset = self.measure_offset(ordering, position)
+                    self.stdout.write(f'{size:>9} {ordering:>8} {depth:>6.0%} {keyset:>11.2f} {offset:>11.2f}')
+
+    def keyset_url(self, ordering, position):
+        url = f'/cars/?ordering={ordering}'
+        if not position:
+            return url
+        paginator = KeysetPagination()
+        paginator.request = None
+        paginator.base_url = 'http://localhost' + url
+        paginator.field, paginator.descending = ordering.lstrip('-'), ordering.startswith('-')
+        obj = CarsModel.objects.order_by(*paginator.order_by(paginator.descending))[position - 1]
+        return paginator.encode_cursor(obj, reverse=False)
+
+    def measure(self, url):
+        timings = []
+        for _ in range(self.repeat):
+            request = self.factory.get(url, SERVER_NAME='localhost')
+            started = time.perf_counter()
+            response = self.view(request)
+            response.render()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def measure_offset(self, ordering, position):
+        queryset = CarsAPIViewSet.queryset.order_by(ordering, 'id')
+        timings = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            list(queryset[position:position + KeysetPagination.page_size])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
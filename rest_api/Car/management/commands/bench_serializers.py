@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from Car.models import CarsModel
+from Car.seed import seed_cars
+from Car.serializers import CarsSerializer, CarsValuesSerializer
+from Car.views import CarsAPIViewSet
+
+from .bench_pagination import Rollback
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость вывода списка объявлений CarsSerializer и CarsValuesSerializer ' \
+           'при 1k, 10k и 100k строк. Данные создаются в транзакции и откатываются.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--fields', default='id,label,model,price',
+                            help='Поля для замера разреженного вывода через запятую')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        try:
+            with transaction.atomic():
+                self.run(sorted(options['rows']), options['fields'].split(','))
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, fields):
+        self.stdout.write(f'{"rows":>7} {"serializer, rows/s":>19} {"values, rows/s":>15} '
+                          f'{"values fields, rows/s":>22}')
+        seeded = CarsModel.objects.count()
+        for size in sizes:
+            if size > seeded:
+                seed_cars(size - seeded)
+                seeded = size
+
+            queryset = CarsAPIViewSet.queryset.order_by('id')[:size]
+            full = self.measure(size, lambda: CarsSerializer(list(queryset), many=True).data)
+            values = self.measure(size, lambda: self.values_data(queryset, None))
+            sparse = self.measure(size, lambda: self.values_data(queryset, fields))
+            self.stdout.write(f'{size:>7} {full:>19.0f} {values:>15.0f} {sparse:>22.0f}')
+
+    def values_data(self, queryset, fields):
+        serializer = CarsValuesSerializer(context={'fields': fields})
+        serializer.instance = queryset.values(*serializer.columns)
+        return serializer.data
+
+    def measure(self, size, serialize):
+        best = None
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            serialize()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return size / best
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Car.cache import cache_is_shared
+from Car.recompute import process_queue
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг объявлений из очереди RatingQueue (CARS_RATING_MODE = "queue")'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Пауза в секундах, когда очередь разобрана: за нее копятся повторные оценки')
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь и завершиться')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            # сброс версий из этого процесса не дошел бы до веб-воркеров, и они отдавали бы старый рейтинг
+            raise CommandError('Нужен кэш, общий с веб-воркерами (REDIS_URL), а не кэш в памяти процесса')
+        while True:
+            count = process_queue(options['batch_size'])
+            if count:
+                self.stdout.write(f'Обработано записей очереди: {count}')
+            if count < options['batch_size']:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
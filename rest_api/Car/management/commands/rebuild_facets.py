@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from Car.cache import invalidate
+from Car.logic import rebuild_facets
+from Car.models import CarsFacetCount, CarsModel
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает счетчики фасетов CarsFacetCount с нуля и сверяет их с объявлениями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только сравнить счетчики с агрегатом, ничего не записывая')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rows = rebuild_facets()
+            invalidate()
+            self.stdout.write(f'Комбинаций фасетов: {rows}')
+
+        expected = {row[:-1]: row[-1] for row in CarsModel.objects.order_by()
+                    .values(*CarsModel.facet_fields).annotate(count=Count('pk'))
+                    .values_list(*CarsModel.facet_fields, 'count').iterator()}
+        actual = {row[:-1]: row[-1] for row in CarsFacetCount.objects.exclude(cars_count=0)
+                  .values_list(*CarsModel.facet_fields, 'cars_count').iterator()}
+
+        errors = 0
+        for key in sorted(expected.keys() | actual.keys()):
+            if expected.get(key, 0) != actual.get(key, 0):
+                errors += 1
+                self.stdout.write(f'{key}: cars_count={actual.get(key, 0)}, ожидалось {expected.get(key, 0)}')
+
+        if errors:
+            raise CommandError(f'Расхождений: {errors}')
+        self.stdout.write(self.style.SUCCESS('Счетчики фасетов совпадают с агрегатом'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+
+from Car.cache import invalidate
+from Car.logic import rebuild_likes
+from Car.models import CarsModel
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает likes_count и customers_count объявлений с нуля и сверяет его с отношениями пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только сравнить счетчики с агрегатом, ничего не записывая')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            updated = rebuild_likes()
+            invalidate()
+            self.stdout.write(f'Пересчитано объявлений: {updated}')
+
+        mismatched = CarsModel.objects.annotate(
+            expected_likes=Count('usercarsrelation', filter=Q(usercarsrelation__like=True)),
+            expected_customers=Count('usercarsrelation'))\
+            .values_list('id', 'likes_count', 'expected_likes', 'customers_count', 'expected_customers')\
+            .order_by('id')
+
+        errors = 0
+        for car_id, likes_count, expected_likes, customers_count, expected_customers in mismatched.iterator():
+            if likes_count != expected_likes:
+                errors += 1
+                self.stdout.write(f'{car_id}: likes_count={likes_count}, ожидалось {expected_likes}')
+            if customers_count != expected_customers:
+                errors += 1
+                self.stdout.write(f'{car_id}: customers_count={customers_count}, ожидалось {expected_customers}')
+
+        if errors:
+            raise CommandError(f'Расхождений: {errors}')
+        self.stdout.write(self.style.SUCCESS('Счетчики лайков совпадают с агрегатом'))
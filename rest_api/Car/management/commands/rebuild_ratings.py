@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count, DecimalField, Sum
+from django.db.models.functions import Cast, Coalesce
+
+from Car.cache import invalidate
+from Car.logic import rebuild_ratings
+from Car.models import CarsModel
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики оценок объявлений с нуля и сверяет их с Sum, Count и Avg(rate)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только сравнить счетчики с агрегатом, ничего не записывая')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            updated = rebuild_ratings()
+            invalidate()
+            self.stdout.write(f'Пересчитано объявлений: {updated}')
+
+        mismatched = CarsModel.objects.annotate(
+            expected_sum=Coalesce(Sum('usercarsrelation__rate'), 0),
+            expected_count=Count('usercarsrelation__rate'),
+            expected_rating=Cast(Avg('usercarsrelation__rate'), DecimalField(max_digits=3, decimal_places=2)))\
+            .values_list('id', 'rating', 'rating_sum', 'rating_count', 'expected_rating', 'expected_sum',
+                         'expected_count').order_by('id')
+
+        errors = 0
+        for car_id, rating, rating_sum, rating_count, expected_rating, expected_sum, expected_count \
+                in mismatched.iterator():
+            # rating_sum проверяется отдельно: новые оценки прибавляются к нему, и ошибка в нем всплывет позже
+            if rating != expected_rating or rating_sum != expected_sum or rating_count != expected_count:
+                errors += 1
+                self.stdout.write(f'{car_id}: rating={rating} ({rating_sum}/{rating_count}), '
+                                  f'ожидалось {expected_rating} ({expected_sum}/{expected_count})')
+
+        if errors:
+            raise CommandError(f'Расхождений: {errors}')
+        self.stdout.write(self.style.SUCCESS('Счетчики оценок совпадают с агрегатом'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Car.logic import refresh_top_listings
+
+
+class Command(BaseCommand):
+    help = 'Обновляет рейтинг популярных объявлений CarsTopListing, не блокируя чтение; запускается по расписанию'
+
+    def handle(self, *args, **options):
+        rows = refresh_top_listings()
+        self.stdout.write(f'Объявлений в рейтинге: {rows}')
@@ -0,0 +1,246 @@
+import glob
+import ipaddress
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, connections
+from django.http import Http404, HttpResponse
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# имя -> (тип, описание, границы корзин гистограммы)
+METRICS = {
+    'cars_http_request_duration_seconds': ('histogram', 'Время ответа по маршрутам роутера', LATENCY_BUCKETS),
+    'cars_http_requests_total': ('counter', 'Ответы по маршрутам и кодам', None),
+    'cars_db_queries_total': ('counter', 'SQL-запросы, выполненные при обработке HTTP-запросов', None),
+    'cars_db_query_seconds_total': ('counter', 'Суммарное время SQL-запросов HTTP-запросов', None),
+    'cars_cache_requests_total': ('counter', 'Обращения к кэшу ответов для анонимов', None),
+    'cars_rating_updates_total': ('counter', 'Обновления рейтинга и счетчиков объявлений', None),
+    'cars_rating_update_duration_seconds': ('histogram', 'Время обновления рейтинга', LATENCY_BUCKETS),
+    'cars_db_connections': ('gauge', 'Соединения с базой на момент сбора', None),
+}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    """
+    Счетчики и гистограммы одного процесса.
+
+    Блокировка берется только на изменение словаря. В многопроцессном режиме
+    (CARS_METRICS_DIR) процесс не чаще раза в CARS_METRICS_FLUSH_INTERVAL
+    секунд сбрасывает свой снимок в файл metrics-<pid>.json, а /metrics
+    складывает файлы всех процессов, как multiprocess-режим prometheus_client.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = {}
+        self.histograms = {}
+        self.flushed = 0.0
+
+    def _check_fork(self):
+        # после fork (gunicorn --preload) воркер не должен унаследовать и повторить чужие значения
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            self._check_fork()
+            self.counters[key] = self.counters.get(key, 0) + value
+        self.maybe_flush()
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, _labels(labels))
+        with self.lock:
+            self._check_fork()
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            self._check_fork()
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(buckets), total, count]
+                               for (name, labels), (buckets, total, count) in self.histograms.items()],
+            }
+
+    def path(self, directory):
+        return os.path.join(directory, f'metrics-{self.pid}.json')
+
+    def maybe_flush(self, force=False):
+        directory = getattr(settings, 'CARS_METRICS_DIR', None)
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self.flushed < getattr(settings, 'CARS_METRICS_FLUSH_INTERVAL', 1.0):
+            return
+        self.flushed = now
+        snapshot = self.snapshot()
+        path = self.path(directory)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(tmp, path)
+
+
+registry = Registry()
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """Записывает длительность блока в гистограмму name."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def observe_request(request, response, duration, queries, db_time):
+    match = getattr(request, 'resolver_match', None)
+    route = match.url_name if match is not None and match.url_name else 'unmatched'
+    observe('cars_http_request_duration_seconds', duration, route=route, method=request.method)
+    inc('cars_http_requests_total', route=route, method=request.method, status=str(response.status_code))
+    if queries:
+        inc('cars_db_queries_total', queries, route=route)
+        inc('cars_db_query_seconds_total', db_time, route=route)
+
+
+def collect():
+    """Снимки всех процессов: свой берется из памяти, остальные — из CARS_METRICS_DIR."""
+    snapshots = [registry.snapshot()]
+    directory = getattr(settings, 'CARS_METRICS_DIR', None)
+    if directory:
+        own = registry.path(directory)
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                # файл удален или еще не дописан: значения попадут в следующий сбор
+                continue
+    return snapshots
+
+
+def merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+    return counters, histograms
+
+
+def db_connections():
+    """Соединения процесса и, на Postgres, всех клиентов базы по состояниям из pg_stat_activity."""
+    gauges = {(('scope', 'process'), ('state', 'open')): sum(
+        conn.connection is not None for conn in connections.all())}
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+                           "WHERE datname = current_database() GROUP BY 1")
+            for state, count in cursor.fetchall():
+                gauges[('scope', 'database'), ('state', state)] = count
+    return gauges
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(counters, histograms, gauges):
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        if kind == 'histogram':
+            series = sorted((labels, value) for (metric, labels), value in histograms.items() if metric == name)
+        elif kind == 'counter':
+            series = sorted((labels, value) for (metric, labels), value in counters.items() if metric == name)
+        else:
+            series = sorted(gauges.get(name, {}).items())
+        if not series:
+            continue
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            counts, total, count = value
+            for bound, cumulative in zip(buckets, counts):
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_allowed(request):
+    """Сборщик с адреса из CARS_METRICS_ALLOWED_IPS (адреса и подсети) или вошедший сотрудник."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False)
+               for network in getattr(settings, 'CARS_METRICS_ALLOWED_IPS', ()))
+
+
+def metrics_view(request):
+    """
+    Метрики всех процессов в текстовом формате Prometheus.
+
+    Внутренняя статистика и запрос к pg_stat_activity не для всех: остальным
+    эндпоинт отвечает 404, как будто его нет.
+    """
+    if not metrics_allowed(request):
+        raise Http404
+    counters, histograms = merge(collect())
+    text = render(counters, histograms, {'cars_db_connections': db_connections()})
+    return HttpResponse(text, content_type=CONTENT_TYPE)
@@ -0,0 +1,37 @@
+# Generated by Django 4.0.6 on 2026-10-18 20:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rating_counters(apps, schema_editor):
+    CarsModel = apps.get_model('Car', 'CarsModel')
+    UserCarsRelation = apps.get_model('Car', 'UserCarsRelation')
+
+    rates = UserCarsRelation.objects.filter(car=OuterRef('pk'), rate__isnull=False).order_by().values('car')
+    CarsModel.objects.update(
+        rating_sum=Coalesce(Subquery(rates.annotate(value=Sum('rate')).values('value')), 0),
+        rating_count=Coalesce(Subquery(rates.annotate(value=Count('rate')).values('value')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0020_alter_carsmodel_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carsmodel',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='carsmodel',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_rating_counters, migrations.RunPython.noop),
+    ]
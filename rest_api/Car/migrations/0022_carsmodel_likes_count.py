@@ -0,0 +1,31 @@
+# Generated by Django 4.0.6 on 2026-10-18 21:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_likes_count(apps, schema_editor):
+    CarsModel = apps.get_model('Car', 'CarsModel')
+    UserCarsRelation = apps.get_model('Car', 'UserCarsRelation')
+
+    likes = UserCarsRelation.objects.filter(car=OuterRef('pk'), like=True).order_by().values('car')
+    CarsModel.objects.update(
+        likes_count=Coalesce(Subquery(likes.annotate(value=Count('pk')).values('value')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0021_carsmodel_rating_count_carsmodel_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carsmodel',
+            name='likes_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Количество лайков'),
+        ),
+        migrations.RunPython(fill_likes_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.6 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0022_carsmodel_likes_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carsmodel',
+            index=models.Index(fields=['date', 'id'], name='car_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carsmodel',
+            index=models.Index(fields=['price', 'id'], name='car_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carsmodel',
+            index=models.Index(fields=['year_of_release', 'id'], name='car_year_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carsmodel',
+            index=models.Index(fields=['likes_count', 'id'], name='car_likes_id_idx'),
+        ),
+    ]
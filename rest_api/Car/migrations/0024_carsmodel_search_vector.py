@@ -0,0 +1,33 @@
+# Generated by Django 4.0.6 on 2026-10-18 22:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def fill_search_vector(apps, schema_editor):
+    CarsModel = apps.get_model('Car', 'CarsModel')
+    CarsModel.objects.update(search_vector=SearchVector('label_id', 'model', config='simple', weight='A') +
+                             SearchVector('description', config='russian', weight='B') +
+                             SearchVector('description', config='simple', weight='C'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0023_carsmodel_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carsmodel',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='carsmodel',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='car_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
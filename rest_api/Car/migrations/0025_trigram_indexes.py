@@ -0,0 +1,38 @@
+# Generated by Django 4.0.6 on 2026-10-18 22:40
+
+from django.db import migrations
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm ставится только если оно есть на сервере: без него
+    # нечеткий поиск работает через icontains, см. Car.search.trigram_enabled
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    quote = schema_editor.quote_name
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(f'CREATE INDEX IF NOT EXISTS car_model_trgm_idx '
+                          f'ON {quote("Car_carsmodel")} USING gin (model gin_trgm_ops)')
+    schema_editor.execute(f'CREATE INDEX IF NOT EXISTS label_name_trgm_idx '
+                          f'ON {quote("Car_labelsmodel")} USING gin (name gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS car_model_trgm_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS label_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0024_carsmodel_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.0.6 on 2026-10-18 20:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('Car', '0025_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='carsmodel',
+            name='label',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='Car.labelsmodel', verbose_name='Марка авто'),
+        ),
+        migrations.AlterField(
+            model_name='carsmodel',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество лайков'),
+        ),
+        migrations.AlterField(
+            model_name='carsmodel',
+            name='owner',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='my_book', to=settings.AUTH_USER_MODEL, verbose_name='Создатель объявления'),
+        ),
+        migrations.AddIndex(
+            model_name='carsmodel',
+            index=models.Index(fields=['label', 'price'], name='car_label_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carsmodel',
+            index=models.Index(fields=['owner', 'date'], name='car_owner_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usercarsrelation',
+            index=models.Index(fields=['user', 'car'], name='relation_user_car_idx'),
+        ),
+    ]
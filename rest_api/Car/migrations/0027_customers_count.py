@@ -0,0 +1,41 @@
+# Generated by Django 4.0.6 on 2026-10-18 20:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_customers_count(apps, schema_editor):
+    CarsModel = apps.get_model('Car', 'CarsModel')
+    UserCarsRelation = apps.get_model('Car', 'UserCarsRelation')
+
+    customers = UserCarsRelation.objects.filter(car=OuterRef('pk')).order_by().values('car')
+    CarsModel.objects.update(
+        customers_count=Coalesce(Subquery(customers.annotate(value=Count('pk')).values('value')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0026_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carsmodel',
+            name='customers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество оценивших'),
+        ),
+        migrations.AddIndex(
+            model_name='usercarsrelation',
+            index=models.Index(fields=['car', 'id'], name='relation_car_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='usercarsrelation',
+            name='car',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Car.carsmodel', verbose_name='Объявление о машине'),
+        ),
+        migrations.RunPython(fill_customers_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.0.6 on 2026-10-18 21:40
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_relations(apps, schema_editor):
+    CarsModel = apps.get_model('Car', 'CarsModel')
+    UserCarsRelation = apps.get_model('Car', 'UserCarsRelation')
+
+    # из повторов пары пользователь-объявление остается последнее отношение
+    newer = UserCarsRelation.objects.filter(user=OuterRef('user'), car=OuterRef('car'), id__gt=OuterRef('id'))
+    duplicates = UserCarsRelation.objects.filter(models.Exists(newer))
+    car_ids = set(duplicates.values_list('car', flat=True))
+    if not car_ids:
+        return
+    duplicates.delete()
+
+    def aggregate(value, output_field, **filters):
+        relations = UserCarsRelation.objects.filter(car=OuterRef('pk'), **filters).order_by().values('car')
+        return Subquery(relations.annotate(value=value).values('value'), output_field=output_field)
+
+    CarsModel.objects.filter(pk__in=car_ids).update(
+        rating_sum=Coalesce(aggregate(Sum('rate'), IntegerField(), rate__isnull=False), 0),
+        rating_count=Coalesce(aggregate(Count('rate'), IntegerField(), rate__isnull=False), 0),
+        rating=aggregate(Avg('rate'), DecimalField(max_digits=3, decimal_places=2), rate__isnull=False),
+        likes_count=Coalesce(aggregate(Count('pk', filter=Q(like=True)), IntegerField()), 0),
+        customers_count=Coalesce(aggregate(Count('pk'), IntegerField()), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0027_customers_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_relations, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='usercarsrelation',
+            name='relation_user_car_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='usercarsrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'car'), name='relation_user_car_uniq'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.6 on 2026-10-18 21:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0028_relation_user_car_uniq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingQueue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('car_id', models.PositiveBigIntegerField(verbose_name='Объявление о машине')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата постановки в очередь')),
+            ],
+            options={
+                'verbose_name': 'Объявление в очереди пересчета',
+                'verbose_name_plural': 'Очередь пересчета рейтинга',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.6 on 2026-10-18 22:10
+
+import Car.choices
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0029_rating_queue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='carsmodel',
+            name='engine_capacity',
+            field=models.DecimalField(decimal_places=1, default=Decimal('1.5'), max_digits=2, validators=[Car.choices.validate_engine_capacity], verbose_name='Объем двигателя'),
+        ),
+        migrations.AlterField(
+            model_name='carsmodel',
+            name='year_of_release',
+            field=models.IntegerField(default=Car.choices.current_year, validators=[Car.choices.validate_year], verbose_name='Год выпуска'),
+        ),
+    ]
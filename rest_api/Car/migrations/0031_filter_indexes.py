@@ -0,0 +1,21 @@
+# Generated by Django 4.0.6 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0030_numeric_engine_capacity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carsmodel',
+            index=models.Index(fields=['engine_capacity', 'id'], name='car_capacity_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='carsmodel',
+            index=models.Index(fields=['rating', 'id'], name='car_rating_id_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.0.6 on 2026-10-18 21:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0031_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarsFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('body_type', models.CharField(choices=[('h', 'Хэтбек'), ('s', 'Седан'), ('u', 'Универсал'), ('k', 'Кабриолет')], max_length=1, verbose_name='Кузов')),
+                ('drive_type', models.CharField(choices=[('f', 'Передний'), ('r', 'Задний'), ('a', 'Полный')], max_length=1, verbose_name='Привод')),
+                ('transmission_type', models.CharField(choices=[('m', 'Механическая'), ('a', 'Автоматическая'), ('r', 'Роботизированная')], max_length=1, verbose_name='Тип КПП')),
+                ('year_of_release', models.IntegerField(verbose_name='Год выпуска')),
+                ('cars_count', models.IntegerField(default=0, verbose_name='Количество объявлений')),
+                ('label', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='Car.labelsmodel', verbose_name='Марка авто')),
+            ],
+            options={
+                'verbose_name': 'Счетчик фасетов',
+                'verbose_name_plural': 'Счетчики фасетов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='carsfacetcount',
+            constraint=models.UniqueConstraint(fields=('label', 'body_type', 'drive_type', 'transmission_type', 'year_of_release'), name='facet_count_key_uniq'),
+        ),
+        migrations.RunSQL(
+            sql='INSERT INTO "Car_carsfacetcount" '
+                '(label_id, body_type, drive_type, transmission_type, year_of_release, cars_count) '
+                'SELECT label_id, body_type, drive_type, transmission_type, year_of_release, count(*) '
+                'FROM "Car_carsmodel" GROUP BY 1, 2, 3, 4, 5',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.0.6 on 2026-10-18 23:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Car', '0032_facet_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarsTopListing',
+            fields=[
+                ('car', models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='top_listing', serialize=False, to='Car.carsmodel', verbose_name='Объявление о машине')),
+                ('position', models.PositiveIntegerField(verbose_name='Место')),
+                ('likes_count', models.PositiveIntegerField(verbose_name='Количество лайков')),
+                ('rating', models.DecimalField(decimal_places=2, max_digits=3, null=True, verbose_name='Рейтинг')),
+            ],
+            options={
+                'verbose_name': 'Популярное объявление',
+                'verbose_name_plural': 'Популярные объявления',
+                'managed': False,
+            },
+        ),
+        # CarsTopListing.TOP_LISTINGS_SIZE строк; уникальный индекс нужен для REFRESH ... CONCURRENTLY
+        migrations.RunSQL(
+            sql=[
+                'CREATE MATERIALIZED VIEW "Car_carstoplisting" AS '
+                'SELECT id AS car_id, row_number() OVER (ORDER BY likes_count DESC, rating DESC NULLS LAST, id) '
+                'AS position, likes_count, rating FROM "Car_carsmodel" '
+                'ORDER BY likes_count DESC, rating DESC NULLS LAST, id LIMIT 100',
+                'CREATE UNIQUE INDEX "car_top_listing_car_uniq" ON "Car_carstoplisting" (car_id)',
+                'CREATE UNIQUE INDEX "car_top_listing_position_uniq" ON "Car_carstoplisting" (position)',
+            ],
+            reverse_sql='DROP MATERIALIZED VIEW "Car_carstoplisting"',
+        ),
+    ]
@@ -1,72 +1,125 @@
-import datetime
+from contextvars import ContextVar
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
 
+from .choices import (BodyType, DriveType, EngineType, ENGINE_CAPACITY_DEFAULT, TransmissionType, current_year,
+                      validate_engine_capacity, validate_year)
 
-def year_choices():
-    return [(y, y) for y in range(1950, datetime.datetime.today().year)]
+# объявления, которые сейчас удаляются вместе со своими отношениями
+_deleting_cars = ContextVar('deleting_cars', default=frozenset())
 
 
-def engine_capacity_choices():
-    return [(str(v/10), str(v/10)) for v in range(5, 61)]
+def car_is_deleting(car_id):
+    """Удаляется ли объявление car_id в этом запросе: его счетчики и кэш поддерживать незачем."""
+    return car_id in _deleting_cars.get()
 
 
 class CarsModel(models.Model):
-    label = models.ForeignKey('LabelsModel', on_delete=models.PROTECT, verbose_name='Марка авто')
+    label = models.ForeignKey('LabelsModel', on_delete=models.PROTECT, db_index=False, verbose_name='Марка авто')
     model = models.CharField(max_length=15, verbose_name='Модель авто')
-    year_of_release = models.IntegerField(
-        choices=year_choices(), default=datetime.datetime.today().year, verbose_name='Год выпуска')
+    # границы года и объема проверяются валидаторами из choices, а не списками вариантов:
+    # списки пересобирались при каждом импорте и меняли миграции с наступлением нового года
+    year_of_release = models.IntegerField(default=current_year, validators=[validate_year], verbose_name='Год выпуска')
     date = models.DateTimeField(verbose_name='Дата создания объявления', auto_now_add=True)
     description = models.TextField(verbose_name='Описание авто', null=True)
     price = models.IntegerField(verbose_name='Цена авто', null=True)
 
-    engine_types = (
-        ('p', 'Бензиновый'),
-        ('d', 'Дизельный'),
-    )
-    engine_type = models.CharField(max_length=1, choices=engine_types, default='p', verbose_name='Тип двигателя')
-    engine_capacity = models.CharField(
-        max_length=3, choices=engine_capacity_choices(), default='1.5', verbose_name='Объем двигателя')
-
-    transmission_types = (
-        ('m', 'Механическая'),
-        ('a', 'Автоматическая'),
-        ('r', 'Роботизированная'),
-    )
+    engine_type = models.CharField(
+        max_length=1, choices=EngineType.choices, default=EngineType.PETROL, verbose_name='Тип двигателя')
+    engine_capacity = models.DecimalField(max_digits=2, decimal_places=1, default=ENGINE_CAPACITY_DEFAULT,
+                                          validators=[validate_engine_capacity], verbose_name='Объем двигателя')
     transmission_type = models.CharField(
-        max_length=1, choices=transmission_types, default='m', verbose_name='Тип КПП')
-
-    drive_types = (
-        ('f', 'Передний'),
-        ('r', 'Задний'),
-        ('a', 'Полный'),
-    )
-    drive_type = models.CharField(max_length=1, choices=drive_types, default='f', verbose_name='Привод')
-
-    body_types = (
-        ('h', 'Хэтбек'),
-        ('s', 'Седан'),
-        ('u', 'Универсал'),
-        ('k', 'Кабриолет'),
-    )
-    body_type = models.CharField(max_length=1, choices=body_types, default='s', verbose_name='Кузов')
-
-    owner = models.ForeignKey(User, verbose_name='Создатель объявления',
+        max_length=1, choices=TransmissionType.choices, default=TransmissionType.MANUAL, verbose_name='Тип КПП')
+    drive_type = models.CharField(
+        max_length=1, choices=DriveType.choices, default=DriveType.FRONT, verbose_name='Привод')
+    body_type = models.CharField(
+        max_length=1, choices=BodyType.choices, default=BodyType.SEDAN, verbose_name='Кузов')
+
+    owner = models.ForeignKey(User, verbose_name='Создатель объявления', db_index=False,
                               on_delete=models.CASCADE, null=True, related_name='my_book')
 
     customers = models.ManyToManyField(User, through='UserCarsRelation',
                                        related_name='rate_books', verbose_name='Оценка пользователей')
 
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=None, null=True)
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')
+    rating_count = models.PositiveIntegerField(default=0, verbose_name='Количество оценок')
+    likes_count = models.PositiveIntegerField(default=0, verbose_name='Количество лайков')
+    customers_count = models.PositiveIntegerField(default=0, verbose_name='Количество оценивших')
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return f'{self.id}: {self.label} {self.model}: {self.year_of_release}'
 
+    # меняются только UPDATE ... SET x = x + delta или пересчетом из отношений
+    counter_fields = ('rating', 'rating_sum', 'rating_count', 'likes_count', 'customers_count', 'search_vector')
+    # колонки, по которым ведется CarsFacetCount
+    facet_fields = ('label_id', 'body_type', 'drive_type', 'transmission_type', 'year_of_release')
+
+    def facet_key(self):
+        return tuple(getattr(self, name) for name in self.facet_fields)
+
+    def save(self, *args, **kwargs):
+        from .logic import update_facet_counts
+        from .search import update_search_vector
+
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # значения счетчиков в памяти устаревают, пока объявление редактируют: не перезаписываем их
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.counter_fields
+                                       and field.attname not in deferred]
+
+        adding = self._state.adding
+        with transaction.atomic():
+            update_fields = kwargs.get('update_fields')
+            locked = not adding and (update_fields is None or {'label', *self.facet_fields} & set(update_fields))
+            if locked:
+                # счетчик фасетов сдвигается от значений в базе: объявление могли изменить параллельно
+                old_key = CarsModel.objects.select_for_update().filter(pk=self.pk).order_by()\
+                    .values_list(*self.facet_fields).first()
+            super().save(*args, **kwargs)
+            new_key = self.facet_key()
+            if adding or locked and old_key != new_key:
+                deltas = {new_key: 1}
+                if not adding and old_key is not None:
+                    deltas[old_key] = -1
+                update_facet_counts(deltas)
+            if update_fields is None or {'label', 'label_id', 'model', 'description'} & set(update_fields):
+                update_search_vector(CarsModel.objects.filter(pk=self.pk))
+
+    def delete(self, *args, **kwargs):
+        # каскад удаляет отношения по одному с сигналами; обновлять счетчики и очередь пересчета
+        # объявления, которое сейчас исчезнет, — лишние запросы на каждого оценившего
+        token = _deleting_cars.set(_deleting_cars.get() | {self.pk})
+        try:
+            return super().delete(*args, **kwargs)
+        finally:
+            _deleting_cars.reset(token)
+
     class Meta:
         verbose_name = 'Объявление о продаже авто'
         verbose_name_plural = 'Объявления о продаже авто'
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date', 'id'], name='car_date_id_idx'),
+            models.Index(fields=['price', 'id'], name='car_price_id_idx'),
+            models.Index(fields=['year_of_release', 'id'], name='car_year_id_idx'),
+            models.Index(fields=['likes_count', 'id'], name='car_likes_id_idx'),
+            # диапазоны фильтров списка; типы двигателя, КПП, привода и кузова индексов не требуют:
+            # у них по 2-4 значения, и их проверяет фильтр поверх индекса сортировки
+            models.Index(fields=['engine_capacity', 'id'], name='car_capacity_id_idx'),
+            models.Index(fields=['rating', 'id'], name='car_rating_id_idx'),
+            # заменяют одиночные индексы внешних ключей label и owner
+            models.Index(fields=['label', 'price'], name='car_label_price_idx'),
+            models.Index(fields=['owner', 'date'], name='car_owner_date_idx'),
+            GinIndex(fields=['search_vector'], name='car_search_vector_idx'),
+        ]
 
 
 class LabelsModel(models.Model):
@@ -87,25 +140,203 @@ def rate_choices():
 
 class UserCarsRelation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
-    car = models.ForeignKey(CarsModel, on_delete=models.CASCADE, verbose_name='Объявление о машине')
+    car = models.ForeignKey(CarsModel, on_delete=models.CASCADE, db_index=False, verbose_name='Объявление о машине')
     like = models.BooleanField(default=False, verbose_name='Like')
     rate = models.PositiveSmallIntegerField(choices=rate_choices(), verbose_name='Рейтинг', null=True)
 
     def __str__(self):
         return f'Отношение пользователя {self.user.username} к объявлению {self.car}'
 
-    def save(self, *args, **kwargs):
-        from .logic import set_rating
+    # оценка и лайк на момент загрузки из базы; у нового отношения их нет
+    _saved_rate = None
+    _saved_like = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # снимок берется из загруженных значений: чтение отложенного поля в __init__ догружало бы его
+        # новым экземпляром, чей __init__ читал бы следующее отложенное поле, и так без конца
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        instance._saved_rate = loaded.get('rate')
+        instance._saved_like = loaded.get('like', False)
+        return instance
+
+    def _lock_current(self):
+        """
+        Блокирует строку отношения и возвращает ее (pk, rate, like) из базы.
 
-        creating = not self.pk
+        Если строку успели удалить, а пару пользователь-объявление создали
+        заново, возвращается новая строка; None — отношения в базе нет.
+        """
+        relations = UserCarsRelation.objects.select_for_update().values_list('pk', 'rate', 'like')
+        return relations.filter(pk=self.pk).first() or \
+            relations.filter(user_id=self.user_id, car_id=self.car_id).first()
 
-        old_rating = self.rate
-        super().save(*args, **kwargs)
-        new_rating = self.rate
+    def _recreate(self):
+        """
+        Заново вставляет отношение, удаленное параллельным запросом.
 
-        if old_rating != new_rating or creating:
-            set_rating(self.car)
+        Если ту же пару успел вставить другой запрос, возвращает его строку
+        из _lock_current(), иначе None.
+        """
+        self.pk = None
+        try:
+            with transaction.atomic():
+                super().save(force_insert=True)
+        except IntegrityError:
+            return self._lock_current()
+        return None
+
+    def save(self, *args, **kwargs):
+        from .logic import update_counters
+        from .recompute import deferred, schedule_recompute
+
+        old_rating, old_like = self._saved_rate, self._saved_like
+        creating = self._state.adding
+        with transaction.atomic():
+            inserted = False
+            if not creating and not deferred():
+                # параллельный запрос мог уже поменять эту оценку: смещение считаем от значения
+                # в базе, а блокировка строки отношения не дает двум запросам взять одно и то же
+                current = self._lock_current()
+                if current is None:
+                    current = self._recreate()
+                    creating = inserted = current is None
+                if current is None:
+                    old_rating, old_like = None, False
+                else:
+                    self.pk, old_rating, old_like = current
+            if not inserted:
+                super().save(*args, **kwargs)
+            new_rating, new_like = self.rate, self.like
+
+            if deferred():
+                schedule_recompute(self.car_id)
+            else:
+                update_counters(self.car_id,
+                                rate_delta=(new_rating or 0) - (old_rating or 0),
+                                count_delta=(new_rating is not None) - (old_rating is not None),
+                                likes_delta=bool(new_like) - bool(old_like),
+                                customers_delta=int(creating))
+        self._saved_rate, self._saved_like = new_rating, new_like
 
     class Meta:
         verbose_name = 'Отношение пользователя к объявлению'
-        verbose_name_plural = 'Отношения пользователей к объявлениям'
\ No newline at end of file
+        verbose_name_plural = 'Отношения пользователей к объявлениям'
+        constraints = [
+            # одно отношение на пару; по нему же работает INSERT ... ON CONFLICT массовой загрузки
+            models.UniqueConstraint(fields=['user', 'car'], name='relation_user_car_uniq'),
+        ]
+        indexes = [
+            # заменяет индекс внешнего ключа car и отдает первых оценивших без сортировки
+            models.Index(fields=['car', 'id'], name='relation_car_id_idx'),
+        ]
+
+
+@receiver(pre_delete, sender=UserCarsRelation)
+def lock_deleted_relation(sender, instance, **kwargs):
+    from .recompute import deferred
+
+    # вычитать из счетчиков нужно то, что лежит в базе, и только если строку удаляет этот запрос
+    if not deferred() and not car_is_deleting(instance.car_id):
+        instance._deleted_state = UserCarsRelation.objects.select_for_update()\
+            .filter(pk=instance.pk).values_list('rate', 'like').first()
+
+
+@receiver(post_delete, sender=UserCarsRelation)
+def discard_counters(sender, instance, **kwargs):
+    from .logic import update_counters
+    from .recompute import deferred, schedule_recompute
+
+    if car_is_deleting(instance.car_id):
+        return
+    if deferred():
+        schedule_recompute(instance.car_id)
+        return
+    state = getattr(instance, '_deleted_state', None)
+    if state is None:
+        return
+    rate, like = state
+    update_counters(instance.car_id,
+                    rate_delta=-(rate or 0),
+                    count_delta=-(rate is not None),
+                    likes_delta=-bool(like),
+                    customers_delta=-1)
+
+
+@receiver(pre_delete, sender=CarsModel)
+def lock_deleted_car(sender, instance, **kwargs):
+    # как и у отношений, из счетчика фасетов вычитаем значения из базы, а не из объекта в памяти
+    instance._deleted_facet_key = CarsModel.objects.select_for_update().filter(pk=instance.pk).order_by()\
+        .values_list(*CarsModel.facet_fields).first()
+
+
+@receiver(post_delete, sender=CarsModel)
+def discard_facet_count(sender, instance, **kwargs):
+    from .logic import update_facet_counts
+
+    key = getattr(instance, '_deleted_facet_key', None)
+    if key is not None:
+        update_facet_counts({key: -1})
+
+
+class CarsFacetCount(models.Model):
+    """
+    Число объявлений в каждой комбинации значений фасетов.
+
+    Ведется смещениями при создании, изменении и удалении объявлений, чтобы
+    /cars/facets/ без фильтров по другим полям считался по нескольким тысячам
+    строк этой таблицы, а не по всем объявлениям. Пересобирается командой
+    rebuild_facets.
+    """
+    label = models.ForeignKey('LabelsModel', on_delete=models.CASCADE, db_index=False, verbose_name='Марка авто')
+    body_type = models.CharField(max_length=1, choices=BodyType.choices, verbose_name='Кузов')
+    drive_type = models.CharField(max_length=1, choices=DriveType.choices, verbose_name='Привод')
+    transmission_type = models.CharField(max_length=1, choices=TransmissionType.choices, verbose_name='Тип КПП')
+    year_of_release = models.IntegerField(verbose_name='Год выпуска')
+    cars_count = models.IntegerField(default=0, verbose_name='Количество объявлений')
+
+    class Meta:
+        verbose_name = 'Счетчик фасетов'
+        verbose_name_plural = 'Счетчики фасетов'
+        constraints = [
+            # по нему же работает INSERT ... ON CONFLICT в update_facet_counts
+            models.UniqueConstraint(fields=['label', 'body_type', 'drive_type', 'transmission_type', 'year_of_release'],
+                                    name='facet_count_key_uniq'),
+        ]
+
+
+class CarsTopListing(models.Model):
+    """
+    Самые популярные объявления: по лайкам, затем по рейтингу.
+
+    Материализованное представление из TOP_LISTINGS_SIZE строк поверх
+    счетчиков CarsModel, чтобы /cars/top/ и главная страница читали готовый
+    рейтинг по индексу, а не сортировали все объявления. Обновляется
+    командой refresh_top_listings без блокировки чтения; до обновления
+    лайки и оценки на место в рейтинге не влияют.
+    """
+    TOP_LISTINGS_SIZE = 100
+
+    car = models.OneToOneField(CarsModel, on_delete=models.DO_NOTHING, primary_key=True, related_name='top_listing',
+                               verbose_name='Объявление о машине')
+    position = models.PositiveIntegerField(verbose_name='Место')
+    likes_count = models.PositiveIntegerField(verbose_name='Количество лайков')
+    rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, verbose_name='Рейтинг')
+
+    class Meta:
+        managed = False
+        verbose_name = 'Популярное объявление'
+        verbose_name_plural = 'Популярные объявления'
+
+
+class RatingQueue(models.Model):
+    """Объявления, которым нужно пересчитать рейтинг и счетчики (CARS_RATING_MODE = 'queue')."""
+    # без внешнего ключа: запись, поставленная до удаления объявления, не мешает удалению и просто
+    # пропускается при разборе; каскадное удаление отношений в очередь не попадает (см. car_is_deleting)
+    car_id = models.PositiveBigIntegerField(verbose_name='Объявление о машине')
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Дата постановки в очередь')
+
+    class Meta:
+        verbose_name = 'Объявление в очереди пересчета'
+        verbose_name_plural = 'Очередь пересчета рейтинга'
@@ -0,0 +1,245 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_rows(queryset):
+    """
+    Оценка числа строк queryset планировщиком Postgres, без чтения таблицы.
+
+    Без фильтров — из pg_class: reltuples с последнего ANALYZE, пересчитанное
+    на текущий размер таблицы, как это делает сам планировщик. С фильтрами —
+    оценка строк верхнего узла EXPLAIN. None, если база не Postgres или
+    таблицу еще ни разу не анализировали.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples, relpages, pg_relation_size(oid) / current_setting(%s)::int '
+                           'FROM pg_class WHERE oid = %s::regclass',
+                           ['block_size', connection.ops.quote_name(queryset.model._meta.db_table)])
+            reltuples, relpages, pages = cursor.fetchone()
+            if reltuples < 0:
+                return None
+            return round(reltuples / relpages * pages) if relpages else round(reltuples)
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+def count_rows(queryset, threshold=None):
+    """
+    Число строк queryset и признак того, что оно приблизительное.
+
+    Точный COUNT(*) проходит по всем подходящим строкам и на больших
+    выборках становится самым дорогим запросом страницы. Поэтому сначала
+    берется оценка планировщика: если она не меньше threshold
+    (CARS_COUNT_EXACT_THRESHOLD), отдается она, иначе строк немного и их
+    считают точно.
+    """
+    if threshold is None:
+        threshold = getattr(settings, 'CARS_COUNT_EXACT_THRESHOLD', 10000)
+    estimate = estimate_rows(queryset)
+    if estimate is not None and estimate >= threshold:
+        return estimate, True
+    return queryset.order_by().count(), False
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничный вывод по ключу (поле сортировки, id) без OFFSET.
+
+    Курсор хранит значения ключа последней (или первой) строки страницы,
+    поэтому следующая страница выбирается условием по индексу (field, id)
+    и не съезжает, когда в таблицу добавляются новые объявления.
+    NULL считается самым большим значением, как в сортировке Postgres.
+    Страница может состоять как из объектов, так и из словарей values().
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = 'id'
+    invalid_cursor_message = 'Неверный курсор'
+    multiple_ordering_message = 'Постраничный вывод поддерживает сортировку только по одному полю'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.annotations = queryset.query.annotations
+        self.page_size = self.get_page_size(request)
+        if len(self.get_ordering_fields(request, queryset, view)) > 1:
+            # курсор хранит значение одного поля: остальные поля сортировки молча потерялись бы
+            raise ValidationError({'ordering': [self.multiple_ordering_message]})
+        self.field, self.descending = self.get_ordering(request, queryset, view)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count, self.count_approximate = count_rows(queryset)
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['reverse'])
+        descending = self.descending != reverse
+
+        queryset = queryset.order_by(*self.order_by(descending))
+        segments = self.after(cursor['value'], cursor['id'], descending) if cursor else [Q()]
+
+        results = []
+        for condition in segments:
+            results += queryset.filter(condition)[:self.page_size + 1 - len(results)]
+            if len(results) > self.page_size:
+                break
+
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            response['count'] = self.count
+            response['count_approximate'] = self.count_approximate
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'count': {'type': 'integer'},
+                'count_approximate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param],
+                                 strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering_fields(self, request, queryset, view):
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                return list(backend().get_ordering(request, queryset, view) or [self.ordering])
+        return [self.ordering]
+
+    def get_ordering(self, request, queryset, view):
+        field = self.get_ordering_fields(request, queryset, view)[0]
+        return field.lstrip('-'), field.startswith('-')
+
+    def order_by(self, descending):
+        sign = '-' if descending else ''
+        if self.field in ('id', 'pk'):
+            return [sign + 'id']
+        return [sign + self.field, sign + 'id']
+
+    def after(self, value, pk, descending):
+        """
+        Условия «строго после (value, pk)» в заданном направлении сортировки.
+
+        Условий может быть несколько: строки с NULL выбираются отдельным
+        запросом, чтобы каждый запрос оставался упорядоченным проходом по индексу.
+        """
+        id_after = Q(id__lt=pk) if descending else Q(id__gt=pk)
+        if self.field in ('id', 'pk'):
+            return [id_after]
+
+        field, isnull = self.field, f'{self.field}__isnull'
+        nullable = self.get_model_field() is None or self.get_model_field().null
+        if value is None:
+            if descending:
+                return [Q(**{isnull: True}) & id_after, Q(**{isnull: False})]
+            return [Q(**{isnull: True}) & id_after]
+
+        if descending:
+            return [Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | id_after)]
+        segments = [Q(**{f'{field}__gte': value}) & (Q(**{f'{field}__gt': value}) | id_after)]
+        if nullable:
+            segments.append(Q(**{isnull: True}))
+        return segments
+
+    def get_model_field(self):
+        """Поле модели, по которому идет сортировка; None для аннотаций вроде search_rank."""
+        try:
+            return self.model._meta.get_field(self.field)
+        except FieldDoesNotExist:
+            return None
+
+    def get_output_field(self):
+        """Поле, которым приводится значение из курсора: поле модели или тип аннотации."""
+        if self.get_model_field() is not None:
+            return self.get_model_field()
+        if self.field in self.annotations:
+            return self.annotations[self.field].output_field
+        return None
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        row = isinstance(obj, dict)
+        if self.field in ('id', 'pk'):
+            value = None
+        else:
+            value = obj[self.field] if row else getattr(obj, self.field)
+        pk = obj['id'] if row else obj.pk
+        payload = {
+            'o': ('-' if self.descending else '') + self.field,
+            'v': value if value is None or isinstance(value, (int, float)) else str(value),
+            'id': pk,
+            'r': int(reverse),
+        }
+        token = urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode()).decode())
+            if payload['o'] != ('-' if self.descending else '') + self.field:
+                raise ValueError
+            value = payload['v']
+            if value is not None and self.get_output_field() is not None:
+                value = self.get_output_field().to_python(value)
+            return {'value': value, 'id': int(payload['id']), 'reverse': bool(payload['r'])}
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
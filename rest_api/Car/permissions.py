@@ -2,13 +2,14 @@ from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 
 class IsAuthenticatedOwnerOrReadOnly(BasePermission):
+    # сравниваем owner_id: obj.owner без select_related стоил бы лишнего запроса на объект
 
     def has_object_permission(self, request, view, obj):
         return bool(
             request.method in SAFE_METHODS or
             request.user and
             request.user.is_authenticated and
-            (obj.owner == request.user or request.user.is_staff)
+            (obj.owner_id == request.user.id or request.user.is_staff)
         )
 
 
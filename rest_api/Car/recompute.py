@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MODES = ('sync', 'thread', 'queue')
+
+
+def get_mode():
+    from .cache import cache_is_shared
+
+    mode = getattr(settings, 'CARS_RATING_MODE', 'sync')
+    if mode not in MODES:
+        raise ImproperlyConfigured(f'CARS_RATING_MODE должен быть одним из {", ".join(MODES)}, а не {mode!r}')
+    # очередь разбирает отдельный процесс: сброс версий из него должен дойти до веб-воркеров
+    if mode == 'queue' and not cache_is_shared():
+        raise ImproperlyConfigured('CARS_RATING_MODE = "queue" требует кэша, общего для всех процессов (REDIS_URL)')
+    return mode
+
+
+def deferred():
+    """Пересчитывается ли рейтинг вне запроса, сохранившего оценку."""
+    return get_mode() != 'sync'
+
+
+def recompute_cars(car_ids, batch_size=1000):
+    """Пересчитывает рейтинг и счетчики объявлений из отношений и сбрасывает их кэш."""
+    from .cache import invalidate_on_commit
+    from .logic import rebuild_likes, rebuild_ratings
+    from .models import CarsModel
+
+    car_ids = sorted(car_ids)
+    for start in range(0, len(car_ids), batch_size):
+        batch = car_ids[start:start + batch_size]
+        metrics.inc('cars_rating_updates_total', len(batch), kind='rebuild')
+        with metrics.timer('cars_rating_update_duration_seconds', kind='rebuild'), transaction.atomic():
+            cars = CarsModel.objects.filter(pk__in=batch)
+            rebuild_ratings(cars)
+            rebuild_likes(cars)
+            for car_id in batch:
+                invalidate_on_commit(car_id)
+
+
+class RecomputeWorker:
+    """
+    Фоновый поток процесса: копит id объявлений и пересчитывает их одной пачкой.
+
+    После первой оценки поток ждет CARS_RATING_WINDOW секунд, чтобы повторные
+    оценки того же объявления схлопнулись в один пересчет. Id, не успевшие
+    обработаться до остановки процесса, теряются; счетчики тогда исправляют
+    команды rebuild_ratings и rebuild_likes.
+    """
+
+    def __init__(self):
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, car_id):
+        with self.lock:
+            self.pending.add(car_id)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='rating-recompute', daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def flush(self):
+        with self.lock:
+            car_ids, self.pending = self.pending, set()
+        if car_ids:
+            recompute_cars(car_ids)
+        return len(car_ids)
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            time.sleep(getattr(settings, 'CARS_RATING_WINDOW', 1.0))
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось пересчитать рейтинг объявлений')
+            finally:
+                connection.close()
+
+
+worker = RecomputeWorker()
+
+
+def schedule_recompute(car_id):
+    """Ставит объявление в очередь пересчета текущего режима CARS_RATING_MODE."""
+    from .models import RatingQueue
+
+    if get_mode() == 'queue':
+        # запись очереди попадает в ту же транзакцию, что и сама оценка
+        RatingQueue.objects.create(car_id=car_id)
+    else:
+        transaction.on_commit(lambda: worker.add(car_id))
+
+
+def process_queue(batch_size=1000):
+    """
+    Забирает до batch_size записей очереди и пересчитывает их объявления по одному разу.
+
+    Записи блокируются с SKIP LOCKED, поэтому несколько обработчиков не
+    мешают друг другу. Возвращает число обработанных записей.
+    """
+    from .models import RatingQueue
+
+    with transaction.atomic():
+        entries = list(RatingQueue.objects.select_for_update(skip_locked=True)
+                       .order_by('id').values_list('id', 'car_id')[:batch_size])
+        if not entries:
+            return 0
+        recompute_cars({car_id for _, car_id in entries}, batch_size=batch_size)
+        # удаляем только заблокированные записи: более новые могли появиться уже после пересчета
+        RatingQueue.objects.filter(id__in=[entry_id for entry_id, _ in entries]).delete()
+    return len(entries)
@@ -0,0 +1,109 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, F, FloatField, Max, Q, Value, When
+from django.db.models.functions import Cast, Greatest
+from rest_framework.filters import SearchFilter
+
+from .models import CarsModel, LabelsModel
+
+_trigram_enabled = {}
+
+
+def trigram_enabled(using='default'):
+    """Установлено ли в базе расширение pg_trgm; без него нечеткий поиск идет через icontains."""
+    if using not in _trigram_enabled:
+        connection = connections[using]
+        enabled = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                enabled = cursor.fetchone() is not None
+        _trigram_enabled[using] = enabled
+    return _trigram_enabled[using]
+
+
+def cars_search_vector():
+    # label_id и есть название марки: у LabelsModel первичный ключ name,
+    # поэтому вектор собирается из колонок самой таблицы объявлений
+    return SearchVector('label_id', 'model', config='simple', weight='A') + \
+        SearchVector('description', config='russian', weight='B') + \
+        SearchVector('description', config='simple', weight='C')
+
+
+def update_search_vector(queryset):
+    return queryset.update(search_vector=cars_search_vector())
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Поиск по сохраненному search_vector вместо ILIKE по нескольким колонкам.
+
+    Каждое слово ищется и как префикс в конфигурации simple, и в русской
+    морфологии; слова объединяются через AND. Результат аннотируется
+    search_rank, по которому можно сортировать (?ordering=-search_rank).
+
+    С ?fuzzy=1 ищет по названиям модели и марки с опечатками и недописанными
+    словами через pg_trgm, а без расширения — по вхождению подстроки.
+    """
+    rank_field = 'search_rank'
+    fuzzy_param = 'fuzzy'
+
+    def get_search_query(self, terms):
+        query = None
+        for term in terms:
+            words = re.findall(r'\w+', term)
+            if not words:
+                continue
+            prefix = ' & '.join(f'{word}:*' for word in words)
+            term_query = SearchQuery(prefix, config='simple', search_type='raw') | \
+                SearchQuery(term, config='russian', search_type='plain')
+            query = term_query if query is None else query & term_query
+        return query
+
+    def filter_fuzzy(self, queryset, terms):
+        term = ' '.join(terms)
+        if trigram_enabled(queryset.db):
+            labels = LabelsModel.objects.filter(name__trigram_word_similar=term).values('name')
+            return queryset.filter(Q(model__trigram_word_similar=term) | Q(label_id__in=labels)).annotate(
+                **{self.rank_field: Greatest(TrigramWordSimilarity(term, 'model'),
+                                             TrigramWordSimilarity(term, 'label_id'))})
+        return queryset.filter(Q(model__icontains=term) | Q(label__name__icontains=term)).annotate(
+            **{self.rank_field: Case(When(Q(model__istartswith=term) | Q(label__name__istartswith=term),
+                                          then=Value(1.0)), default=Value(0.5), output_field=FloatField())})
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if terms and request.query_params.get(self.fuzzy_param) in ('1', 'true'):
+            return self.filter_fuzzy(queryset, terms)
+
+        query = self.get_search_query(terms)
+        if query is None:
+            return queryset.annotate(**{self.rank_field: Value(0.0, output_field=FloatField())})
+        # ts_rank возвращает real: приводим к double, чтобы значение из курсора сравнивалось точно
+        return queryset.filter(search_vector=query)\
+            .annotate(**{self.rank_field: Cast(SearchRank(F('search_vector'), query), FloatField())})
+
+
+def autocomplete(term, limit=10, using='default'):
+    """Лучшие по похожести марки и модели для строки поиска."""
+    cars = CarsModel.objects.using(using).order_by()
+    labels = LabelsModel.objects.using(using).order_by()
+    if trigram_enabled(using):
+        cars = cars.filter(model__trigram_word_similar=term)\
+            .values('label_id', 'model').annotate(similarity=Max(TrigramWordSimilarity(term, 'model')))
+        labels = labels.filter(name__trigram_word_similar=term)\
+            .annotate(similarity=TrigramWordSimilarity(term, 'name'))
+    else:
+        prefix = Case(When(model__istartswith=term, then=Value(1.0)), default=Value(0.5), output_field=FloatField())
+        cars = cars.filter(model__icontains=term).values('label_id', 'model').annotate(similarity=Max(prefix))
+        labels = labels.filter(name__icontains=term).annotate(similarity=Case(
+            When(name__istartswith=term, then=Value(1.0)), default=Value(0.5), output_field=FloatField()))
+
+    return {
+        'labels': [{'name': name, 'similarity': similarity} for name, similarity in
+                   labels.order_by('-similarity', 'name').values_list('name', 'similarity')[:limit]],
+        'models': [{'label': car['label_id'], 'model': car['model'], 'similarity': car['similarity']}
+                   for car in cars.order_by('-similarity', 'model')[:limit]],
+    }
@@ -0,0 +1,64 @@
+import datetime
+import random
+from collections import Counter
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import DateTimeField, ExpressionWrapper, F, Value
+
+from .cache import invalidate
+from .choices import BodyType, DriveType, EngineType, TransmissionType
+from .logic import update_facet_counts, upsert_relations
+from .models import CarsModel, LabelsModel
+from .search import cars_search_vector
+
+SEED_LABELS = ('Lada', 'Toyota', 'Subaru', 'Kia', 'BMW', 'Audi', 'Ford', 'Skoda')
+SEED_MODELS = ('Granta', 'Vesta', 'Camry', 'Corolla', 'impreza', 'Rio', 'X5', 'A4', 'Focus', 'Octavia')
+SEED_CAPACITIES = tuple(Decimal(f'{liters / 10:.1f}') for liters in range(10, 51, 2))
+
+
+def seed_cars(count, batch_size=10000, owner=None, rng=None):
+    """Быстро добавляет count объявлений со случайными ценами и датами и возвращает их id."""
+    rng = rng or random.Random(0)
+    labels = [LabelsModel.objects.get_or_create(name=name)[0] for name in SEED_LABELS]
+    car_ids = []
+    for start in range(0, count, batch_size):
+        batch = [
+            CarsModel(label=rng.choice(labels), model=rng.choice(SEED_MODELS),
+                      year_of_release=rng.randint(1990, 2021), owner=owner,
+                      price=rng.choice((None,) + tuple(range(100000, 5000000, 50000))),
+                      engine_type=rng.choice(EngineType.values), engine_capacity=rng.choice(SEED_CAPACITIES),
+                      transmission_type=rng.choice(TransmissionType.values), drive_type=rng.choice(DriveType.values),
+                      body_type=rng.choice(BodyType.values), description='Объявление для нагрузочного теста')
+            for _ in range(min(batch_size, count - start))
+        ]
+        created = CarsModel.objects.bulk_create(batch, batch_size=batch_size)
+        update_facet_counts(Counter(car.facet_key() for car in created))
+        car_ids += [car.pk for car in created]
+
+    if car_ids:
+        # auto_now_add ставит всем строкам одну дату, разносим их по секундам
+        base = datetime.datetime(2020, 1, 1)
+        CarsModel.objects.filter(id__gte=car_ids[0]).update(date=ExpressionWrapper(
+            Value(base) + F('id') * Value(datetime.timedelta(seconds=1)), output_field=DateTimeField()),
+            search_vector=cars_search_vector())
+        invalidate()
+    return car_ids
+
+
+def seed_users(count, prefix='seed_user', batch_size=10000):
+    """Добавляет count пользователей без пароля и возвращает их id."""
+    first = User.objects.filter(username__startswith=f'{prefix}_').count()
+    users = User.objects.bulk_create(
+        [User(username=f'{prefix}_{first + i}', first_name='Тест', last_name=str(first + i)) for i in range(count)],
+        batch_size=batch_size)
+    return [user.pk for user in users]
+
+
+def seed_relations(car_ids, user_ids, per_car, batch_size=10000, rng=None):
+    """Каждому объявлению — per_car случайных лайков и оценок от разных пользователей."""
+    rng = rng or random.Random(0)
+    per_car = min(per_car, len(user_ids))
+    relations = ((user_id, car_id, rng.random() < 0.5, rng.choice((None, 1, 2, 3, 4, 5)))
+                 for car_id in car_ids for user_id in rng.sample(user_ids, per_car))
+    return upsert_relations(relations, batch_size=batch_size)
@@ -1,41 +1,238 @@
+from collections.abc import Mapping
+
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.functional import cached_property
 from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import SkipField, empty, get_error_detail
 
-from .models import CarsModel, UserCarsRelation, LabelsModel
+from .logic import attach_customers_preview, customers_preview
+from .models import CarsModel, UserCarsRelation, LabelsModel, rate_choices
+from .timing import TimedRepresentationMixin, measure
 
 
-class CarsCustomersSerializer(serializers.ModelSerializer):
+class CarsCustomersSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('first_name', 'last_name')
 
 
-class CarsSerializer(serializers.ModelSerializer):
+class CarsListSerializer(TimedRepresentationMixin, serializers.ListSerializer):
+    def to_representation(self, data):
+        # превью оценивших для всей страницы выбирается одним запросом
+        if 'customers' in self.child.fields and not self.context.get('expand_customers'):
+            data = list(data.all() if hasattr(data, 'all') else data)
+            attach_customers_preview(data, self.child.customers_preview_size)
+        return super().to_representation(data)
+
+
+class CarsSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
+    """
+    Объявление с первыми customers_preview_size оценившими и их общим числом.
+
+    Полный список оценивших отдается только с ?expand=customers (контекст
+    expand_customers) или постранично через /cars/<id>/customers/.
+    Если в контексте передан fields, выводятся только эти поля.
+    """
+    customers_preview_size = 5
+
     # likes_count = serializers.SerializerMethodField()
     likes_count = serializers.IntegerField(read_only=True)
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
     owner_name = serializers.CharField(source='owner.username', default='', read_only=True)
     # label = serializers.CharField(source='label')
-    customers = CarsCustomersSerializer(many=True, read_only=True)
+    customers = serializers.SerializerMethodField()
+    customers_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = CarsModel
         fields = ('id', 'label', 'model', 'year_of_release',
                   'date', 'description', 'price', 'engine_type',
                   'engine_capacity', 'transmission_type', 'drive_type',
-                  'body_type', 'owner_name', 'likes_count', 'rating', 'customers')
+                  'body_type', 'owner_name', 'likes_count', 'rating', 'customers', 'customers_count')
+        list_serializer_class = CarsListSerializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only = self.context.get('fields')
+        if only:
+            fields = {name: field for name, field in fields.items() if name in only}
+        return fields
+
+    def get_customers(self, instance):
+        if self.context.get('expand_customers'):
+            return CarsCustomersSerializer(instance.customers.all(), many=True).data
+        attach_customers_preview([instance], self.customers_preview_size)
+        return instance.customers_preview
 
     # def get_likes_count(self, instance):
     #     return UserCarsRelation.objects.filter(car=instance, like=True).count()
 
 
-class UserCarsRelationSerializer(serializers.ModelSerializer):
+class PreloadedLabelField(serializers.PrimaryKeyRelatedField):
+    """Марка из словаря context['labels'] вместо запроса к базе на каждую строку."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, (str, int)):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.context['labels'][str(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class CarsBulkSerializer(CarsSerializer):
+    """
+    Проверка строк массовой загрузки: марки загружаются заранее одним запросом.
+
+    Один экземпляр проверяет все строки, поэтому список записываемых полей
+    собирается один раз, а не перебором fields на каждой строке; сами поля
+    проверяются как обычно, через run_validation.
+    """
+    label = PreloadedLabelField(queryset=LabelsModel.objects.all())
+
+    class Meta(CarsSerializer.Meta):
+        pass
+
+    def run_validation(self, data=empty):
+        # у CarsSerializer нет validate() и проверок уровня объекта: строка проверяется одними полями
+        if isinstance(data, Mapping) and not self.validators:
+            return self.to_internal_value(data)
+        return super().run_validation(data)
+
+    @cached_property
+    def writable_fields(self):
+        return [(name, field) for name, field in self.fields.items() if not field.read_only]
+
+    def to_internal_value(self, data):
+        if not isinstance(data, Mapping):
+            return super().to_internal_value(data)
+        validated, errors = {}, {}
+        for name, field in self.writable_fields:
+            try:
+                validated[field.source] = field.run_validation(data.get(name, empty))
+            except ValidationError as exc:
+                errors[name] = exc.detail
+            except DjangoValidationError as exc:
+                errors[name] = get_error_detail(exc)
+            except SkipField:
+                pass
+        if errors:
+            raise ValidationError(errors)
+        return validated
+
+
+def cars_columns(fields):
+    """Колонки для only()/values(), нужные полям CarsSerializer; customers не требует ни одной."""
+    columns = ['id']
+    for name, field in fields.items():
+        if name != 'customers' and field.source != 'id':
+            columns.append(field.source.replace('.', '__'))
+    return columns
+
+
+class CarsValuesSerializer:
+    """
+    Быстрый вывод CarsSerializer только для чтения из строк values().
+
+    Поля разбираются один раз при создании: для целых, строк, вариантов выбора
+    и первичных ключей значение из базы переносится как есть, и только дата и
+    рейтинг проходят через to_representation полей DRF. Результат совпадает
+    с CarsSerializer(many=True) без expand_customers.
+    """
+    plain_fields = (serializers.IntegerField, serializers.CharField, serializers.ChoiceField,
+                    serializers.PrimaryKeyRelatedField)
+
+    def __init__(self, instance=None, many=True, context=None):
+        self.instance = instance
+        fields = CarsSerializer(context=context or {}).fields
+        self.columns = cars_columns(fields)
+        self.preview = 'customers' in fields
+        self.plan = []
+        for name, field in fields.items():
+            if name == 'customers':
+                self.plan.append((name, None, None, None))
+                continue
+            convert = None if isinstance(field, self.plain_fields) else field.to_representation
+            default = None if field.default is serializers.empty else field.default
+            self.plan.append((name, field.source.replace('.', '__'), convert, default))
+
+    @property
+    def data(self):
+        with measure('serializer'):
+            return self.to_representation(self.instance)
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        previews = customers_preview([row['id'] for row in rows], CarsSerializer.customers_preview_size) \
+            if self.preview else {}
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert, default in self.plan:
+                if column is None:
+                    item[name] = previews[row['id']]
+                    continue
+                value = row[column]
+                if value is None:
+                    item[name] = default
+                elif convert is None:
+                    item[name] = value
+                else:
+                    item[name] = convert(value)
+            data.append(item)
+        return data
+
+
+class UserCarsRelationSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = UserCarsRelation
         fields = ('car', 'like', 'rate')
 
 
-class LabelsSerializer(serializers.ModelSerializer):
+class UserCarsRelationBulkSerializer(serializers.Serializer):
+    """Строка массовой загрузки отношений: полное состояние пары пользователь-объявление."""
+    user = serializers.IntegerField(min_value=1)
+    car = serializers.IntegerField(min_value=1)
+    like = serializers.BooleanField()
+    rate = serializers.ChoiceField(choices=rate_choices(), allow_null=True)
+
+
+def validate_relation_rows(rows, start=0):
+    """
+    Проверяет строки массовой загрузки отношений.
+
+    Возвращает кортежи (user_id, car_id, like, rate) для upsert_relations и
+    ошибки [{'row': номер, 'errors': {...}}]; существование пользователей и
+    объявлений проверяется двумя запросами на все строки.
+    """
+    serializer = UserCarsRelationBulkSerializer()
+    valid, errors = [], []
+    for number, row in enumerate(rows, start):
+        try:
+            valid.append((number, serializer.run_validation(row)))
+        except serializers.ValidationError as exc:
+            errors.append({'row': number, 'errors': exc.detail})
+
+    users = set(User.objects.filter(pk__in={data['user'] for _, data in valid}).values_list('pk', flat=True))
+    cars = set(CarsModel.objects.filter(pk__in={data['car'] for _, data in valid}).values_list('pk', flat=True))
+    relations = []
+    for number, data in valid:
+        missing = {}
+        if data['user'] not in users:
+            missing['user'] = [f'Пользователь {data["user"]} не найден']
+        if data['car'] not in cars:
+            missing['car'] = [f'Объявление {data["car"]} не найдено']
+        if missing:
+            errors.append({'row': number, 'errors': missing})
+        else:
+            relations.append((data['user'], data['car'], data['like'], data['rate']))
+    errors.sort(key=lambda error: error['row'])
+    return relations, errors
+
+
+class LabelsSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     class Meta:
         model = LabelsModel
         fields = '__all__'
@@ -1,16 +1,26 @@
 import json
+import tempfile
+from base64 import urlsafe_b64encode
+from io import StringIO
+from decimal import Decimal
+from unittest import mock
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.db import connection
-from django.db.models import Count, Case, When, Avg
+from django.test import override_settings
 from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from Car.cache import get_cache
+from Car.choices import YEAR_MIN, current_year
 from Car.models import CarsModel, LabelsModel, UserCarsRelation
 
+from Car.search import trigram_enabled
 from Car.serializers import CarsSerializer
+from Car.views import CarsAPIViewSet
 
 
 class CarAPITestCase(APITestCase):
@@ -36,52 +46,319 @@ class CarAPITestCase(APITestCase):
         url = reverse('carsmodel-list')
         response = self.client.get(url)
 
-        queryset = CarsModel.objects.annotate(
-            likes_count=Count(Case(When(usercarsrelation__like=True, then=1)))).select_related('owner', 'label')\
+        queryset = CarsModel.objects.select_related('owner', 'label')\
             .prefetch_related('customers').order_by('id')
         serializer_data = CarsSerializer(queryset, many=True).data
 
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
 
     def test_get_filter(self):
         url = reverse('carsmodel-list')
         response = self.client.get(url, data={'price': 100000})
-        queryset = CarsModel.objects.filter(id__in=[self.car_1.id, self.car_2.id]).annotate(
-            likes_count=Count(Case(When(usercarsrelation__like=True, then=1)))).select_related('owner', 'label')\
+        queryset = CarsModel.objects.filter(id__in=[self.car_1.id, self.car_2.id]).select_related('owner', 'label')\
             .prefetch_related('customers').order_by('id')
         serializer_data = CarsSerializer(queryset, many=True).data
 
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
+
+    def test_get_filter_ranges(self):
+        CarsModel.objects.filter(pk=self.car_2.pk).update(engine_type='d', engine_capacity='2.5', body_type='u')
+        CarsModel.objects.filter(pk=self.car_3.pk).update(engine_capacity='2.0', body_type='h', rating='4.50')
+        url = reverse('carsmodel-list')
+        cases = (
+            ({'price__gte': 100001}, [self.car_3]),
+            ({'price__lte': 100000, 'year_of_release__gte': 2010}, [self.car_2]),
+            ({'year_of_release__gte': 2008, 'year_of_release__lte': 2018}, [self.car_1, self.car_3]),
+            ({'engine_capacity__gte': '2.0'}, [self.car_2, self.car_3]),
+            ({'engine_capacity__gte': '2.0', 'engine_capacity__lte': '2.4'}, [self.car_3]),
+            ({'rating__gte': '4.6'}, [self.car_1]),
+            ({'rating__gte': '4'}, [self.car_1, self.car_3]),
+            ({'label': ['Lada', 'Subaru']}, [self.car_1, self.car_3]),
+            ({'label': 'Kia'}, []),
+            ({'engine_type': 'd'}, [self.car_2]),
+            ({'body_type': ['u', 'h'], 'price': 100000}, [self.car_2]),
+            ({'transmission_type': ['m', 'a'], 'drive_type': 'f'}, [self.car_1, self.car_2, self.car_3]),
+        )
+        for data, cars in cases:
+            response = self.client.get(url, data=data)
+            self.assertEqual(status.HTTP_200_OK, response.status_code, data)
+            self.assertEqual([car.id for car in cars], [car['id'] for car in response.data['results']], data)
+
+    def test_get_filter_wrong(self):
+        url = reverse('carsmodel-list')
+        for data in ({'engine_type': 'x'}, {'body_type': ['s', 'x']}, {'price__gte': 'дорого'},
+                     {'engine_capacity__lte': 'много'}):
+            response = self.client.get(url, data=data)
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code, data)
 
     def test_get_search(self):
         url = reverse('carsmodel-list')
         response = self.client.get(url, data={'search': 'Toyota'})
-        queryset = CarsModel.objects.filter(id__in=[self.car_2.id, self.car_3.id]).annotate(
-            likes_count=Count(Case(When(usercarsrelation__like=True, then=1)))).select_related('owner', 'label')\
+        queryset = CarsModel.objects.filter(id__in=[self.car_2.id, self.car_3.id]).select_related('owner', 'label')\
             .prefetch_related('customers').order_by('id')
         serializer_data = CarsSerializer(queryset, many=True).data
 
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
+
+    def test_get_search_morphology(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'search': 'двигателя'})
+        self.assertEqual([self.car_3.id], [car['id'] for car in response.data['results']])
+
+        response = self.client.get(url, data={'search': 'impr'})
+        self.assertEqual([self.car_3.id], [car['id'] for car in response.data['results']])
+
+    def test_get_search_rank(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'search': 'toyota', 'ordering': '-search_rank', 'page_size': 1})
+        self.assertEqual([self.car_2.id], [car['id'] for car in response.data['results']])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([self.car_3.id], [car['id'] for car in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+    def test_get_search_after_update(self):
+        self.car_1.description = 'Не бита, не крашена'
+        self.car_1.save()
+
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'search': 'крашена'})
+        self.assertEqual([self.car_1.id], [car['id'] for car in response.data['results']])
+
+    def test_get_search_fuzzy(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'search': 'imprez', 'fuzzy': 1})
+        self.assertEqual([self.car_3.id], [car['id'] for car in response.data['results']])
+
+        response = self.client.get(url, data={'search': 'grant', 'fuzzy': 1})
+        self.assertEqual([self.car_1.id], [car['id'] for car in response.data['results']])
+
+    def test_get_search_fuzzy_typo(self):
+        if not trigram_enabled():
+            self.skipTest('pg_trgm не установлено')
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'search': 'imprexa', 'fuzzy': 1})
+        self.assertEqual([self.car_3.id], [car['id'] for car in response.data['results']])
+
+    def test_autocomplete(self):
+        url = reverse('carsmodel-autocomplete')
+        response = self.client.get(url, data={'q': 'grant'})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([], response.data['labels'])
+        self.assertEqual([('Lada', 'Granta')], [(car['label'], car['model']) for car in response.data['models']])
+
+        response = self.client.get(url, data={'q': 'toy', 'limit': 1})
+        self.assertEqual(['Toyota'], [label['name'] for label in response.data['labels']])
 
     def test_get_order(self):
         url = reverse('carsmodel-list')
         response = self.client.get(url, data={'ordering': 'year_of_release'})
-        queryset = CarsModel.objects.annotate(
-            likes_count=Count(Case(When(usercarsrelation__like=True, then=1)))).select_related('owner', 'label')\
+        queryset = CarsModel.objects.select_related('owner', 'label')\
             .prefetch_related('customers').order_by('year_of_release')
         serializer_data = CarsSerializer(queryset, many=True).data
 
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data['results'])
+
+    def test_get_order_likes(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'ordering': '-likes_count', 'likes_count__gte': 1})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.car_1.id], [car['id'] for car in response.data['results']])
+        self.assertEqual(1, response.data['results'][0]['likes_count'])
+
+    def _walk(self, params, link='previous'):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data=params)
+        pages = [response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data['results'])
+        back = [response.data['results']]
+        while response.data[link]:
+            response = self.client.get(response.data[link])
+            back.insert(0, response.data['results'])
+        return [car['id'] for page in pages for car in page], [car['id'] for page in back for car in page]
+
+    def test_get_pages(self):
+        self.car_2.price = None
+        self.car_2.save()
+        ids = list(CarsModel.objects.order_by('price', 'id').values_list('id', flat=True))
+
+        forward, backward = self._walk({'ordering': 'price', 'page_size': 1})
+        self.assertEqual(ids, forward)
+        self.assertEqual(ids, backward)
+
+        forward, backward = self._walk({'ordering': '-price', 'page_size': 1})
+        self.assertEqual(ids[::-1], forward)
+        self.assertEqual(ids[::-1], backward)
+
+    def test_get_order_multiple(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'ordering': 'price,-date'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('ordering', response.data)
+
+        response = self.client.get(reverse('carsmodel-export'), data={'ordering': 'price,-date'})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
+
+    def test_get_pages_insert(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'ordering': 'date', 'page_size': 2})
+        self.assertEqual([self.car_1.id, self.car_2.id], [car['id'] for car in response.data['results']])
+
+        car_4 = CarsModel.objects.create(label=self.label_1, model='Vesta', year_of_release=2020, owner=self.user_1)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([self.car_3.id, car_4.id], [car['id'] for car in response.data['results']])
+
+    def test_get_count(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'page_size': 1})
+        self.assertNotIn('count', response.data)
+
+        response = self.client.get(url, data={'page_size': 1, 'count': 1, 'price': 100000})
+        self.assertEqual(2, response.data['count'])
+        self.assertFalse(response.data['count_approximate'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(2, response.data['count'])
+
+    @override_settings(CARS_COUNT_EXACT_THRESHOLD=1)
+    def test_get_count_approximate(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(CarsModel._meta.db_table)}')
+        url = reverse('carsmodel-list')
+
+        response = self.client.get(url, data={'count': 1})
+        self.assertEqual(3, response.data['count'])
+        self.assertTrue(response.data['count_approximate'])
+
+        response = self.client.get(url, data={'count': 1, 'price__gte': 200000})
+        self.assertEqual(1, response.data['count'])
+        self.assertTrue(response.data['count_approximate'])
+
+        with override_settings(CARS_COUNT_EXACT_THRESHOLD=10):
+            response = self.client.get(url, data={'count': 1, 'page_size': 10})
+        self.assertEqual(3, response.data['count'])
+        self.assertFalse(response.data['count_approximate'])
+
+    def test_get_wrong_cursor(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'cursor': 'abc'})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_get_tampered_cursor(self):
+        # search_rank — аннотация, а не поле модели: значение из курсора тоже должно проверяться
+        url = reverse('carsmodel-list')
+        for value in ('abc', [1], {'a': 1}):
+            payload = {'o': '-search_rank', 'v': value, 'id': self.car_1.id, 'r': 0}
+            cursor = urlsafe_b64encode(json.dumps(payload).encode()).decode()
+            response = self.client.get(url, data={'search': 'toyota', 'ordering': '-search_rank', 'cursor': cursor})
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_export(self):
+        url = reverse('carsmodel-export')
+        response = self.client.get(url, data={'search': 'Toyota'})
+        queryset = CarsModel.objects.filter(id__in=[self.car_2.id, self.car_3.id]).select_related('owner', 'label')\
+            .prefetch_related('customers').order_by('id')
+        serializer_data = CarsSerializer(queryset, many=True).data
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(json.dumps(serializer_data)),
+                         json.loads(b''.join(response.streaming_content)))
+
+    def test_export_ndjson(self):
+        url = reverse('carsmodel-export')
+        with mock.patch.object(CarsAPIViewSet, 'export_chunk_size', 2):
+            response = self.client.get(url, data={'ndjson': 1})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.car_1.id, self.car_2.id, self.car_3.id], [json.loads(line)['id'] for line in lines])
+        self.assertEqual([{'first_name': '', 'last_name': ''}], json.loads(lines[0])['customers'])
+
+    def test_customers_preview(self):
+        users = [User.objects.create(username=f'customer_{i}', first_name=f'Имя {i}') for i in range(7)]
+        for user in users:
+            UserCarsRelation.objects.create(car=self.car_2, user=user)
+        url = reverse('carsmodel-list')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, sum('"Car_usercarsrelation"' in query['sql'] for query in queries.captured_queries))
+
+        car_2 = response.data['results'][1]
+        self.assertEqual(7, car_2['customers_count'])
+        self.assertEqual([user.first_name for user in users[:CarsSerializer.customers_preview_size]],
+                         [customer['first_name'] for customer in car_2['customers']])
+
+        response = self.client.get(reverse('carsmodel-detail', args=(self.car_2.id,)))
+        self.assertEqual(CarsSerializer.customers_preview_size, len(response.data['customers']))
+
+        response = self.client.get(url, data={'expand': 'customers'})
+        self.assertEqual(7, len(response.data['results'][1]['customers']))
+
+    def test_customers(self):
+        users = [User.objects.create(username=f'customer_{i}', first_name=f'Имя {i}') for i in range(3)]
+        for user in users:
+            UserCarsRelation.objects.create(car=self.car_2, user=user)
+        url = reverse('carsmodel-customers', args=(self.car_2.id,))
+
+        response = self.client.get(url, data={'page_size': 2})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(['Имя 0', 'Имя 1'], [customer['first_name'] for customer in response.data['results']])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(['Имя 2'], [customer['first_name'] for customer in response.data['results']])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(reverse('carsmodel-customers', args=(0,)))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_get_fields(self):
+        url = reverse('carsmodel-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data={'fields': 'id,model', 'ordering': '-price', 'page_size': 2})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([{'id': self.car_3.id, 'model': 'impreza'}, {'id': self.car_2.id, 'model': 'Camry'}],
+                         response.data['results'])
+        self.assertEqual(1, len(queries.captured_queries))
+        self.assertNotIn('"description"', queries.captured_queries[0]['sql'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([{'id': self.car_1.id, 'model': 'Granta'}], response.data['results'])
+
+    def test_get_fields_search(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'fields': 'id', 'search': 'toyota', 'ordering': '-search_rank'})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({self.car_2.id, self.car_3.id}, {car['id'] for car in response.data['results']})
+
+    def test_get_fields_alone(self):
+        url = reverse('carsmodel-detail', args=(self.car_1.id,))
+        response = self.client.get(url, data={'fields': 'model,rating'})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'model': 'Granta', 'rating': '5.00'}, response.data)
+
+    def test_get_fields_wrong(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'fields': 'id,password'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
 
     def test_get_alone(self):
         url = reverse('carsmodel-detail', args=(self.car_1.id,))
         response = self.client.get(url)
-        queryset = CarsModel.objects.filter(id=self.car_1.id).annotate(
-            likes_count=Count(Case(When(usercarsrelation__like=True, then=1)))).select_related('owner', 'label')\
+        queryset = CarsModel.objects.filter(id=self.car_1.id).select_related('owner', 'label')\
             .prefetch_related('customers')
         serializer_data = CarsSerializer(queryset[0]).data
 
@@ -106,6 +383,96 @@ class CarAPITestCase(APITestCase):
         self.assertEqual(status.HTTP_201_CREATED, response.status_code)
         self.assertEqual(4, CarsModel.objects.all().count())
 
+    def test_create_year_range(self):
+        url = reverse('carsmodel-list')
+        self.client.force_login(self.user_1)
+        for year, expected in ((current_year(), status.HTTP_201_CREATED), (YEAR_MIN, status.HTTP_201_CREATED),
+                               (YEAR_MIN - 1, status.HTTP_400_BAD_REQUEST),
+                               (current_year() + 1, status.HTTP_400_BAD_REQUEST)):
+            data = {'model': 'Priora', 'year_of_release': year, 'label': self.label_1.pk, 'price': 250000}
+            response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+            self.assertEqual(expected, response.status_code, year)
+
+    def test_create_engine_capacity(self):
+        url = reverse('carsmodel-list')
+        self.client.force_login(self.user_1)
+        for capacity in ('1.65', '6.5', '0.4'):
+            data = {'model': 'Priora', 'engine_capacity': capacity, 'label': self.label_1.pk, 'price': 250000}
+            response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code, capacity)
+
+        data = {'model': 'Priora', 'engine_capacity': '2.0', 'label': self.label_1.pk, 'price': 250000}
+        response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        car = CarsModel.objects.get(pk=response.data['id'])
+        self.assertEqual(Decimal('2.0'), car.engine_capacity)
+        self.assertEqual([car.pk], list(CarsModel.objects.filter(engine_capacity__gte=2).values_list('pk', flat=True)))
+
+    def test_create_wrong_choice(self):
+        url = reverse('carsmodel-list')
+        self.client.force_login(self.user_1)
+        data = {'model': 'Priora', 'engine_type': 'x', 'label': self.label_1.pk, 'price': 250000}
+        response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('engine_type', response.data)
+
+    def test_bulk(self):
+        url = reverse('carsmodel-bulk')
+        self.client.force_login(self.user_2)
+        data = [
+            {'label': 'Lada', 'model': 'Priora', 'year_of_release': 2012, 'price': 250000,
+             'description': 'Редкий кабриолет'},
+            {'label': 'Mazda', 'model': 'CX-5'},
+            {'label': 'Toyota', 'model': 'Corolla', 'year_of_release': 1900},
+            'не объявление',
+            {'label': 'Toyota', 'model': 'Corolla'},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data=json.dumps(data), content_type='application/json')
+
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(2, response.data['created'])
+        self.assertEqual([1, 2, 3], [error['row'] for error in response.data['errors']])
+        self.assertIn('label', response.data['errors'][0]['errors'])
+        self.assertIn('year_of_release', response.data['errors'][1]['errors'])
+        self.assertLess(len(queries), 10)
+
+        cars = CarsModel.objects.filter(id__in=response.data['ids']).order_by('id')
+        self.assertEqual(['Priora', 'Corolla'], [car.model for car in cars])
+        self.assertEqual({self.user_2}, {car.owner for car in cars})
+        response = self.client.get(reverse('carsmodel-list'), data={'search': 'кабриолет'})
+        self.assertEqual(['Priora'], [car['model'] for car in response.data['results']])
+        call_command('rebuild_facets', '--check', stdout=StringIO())
+
+    def test_bulk_ndjson(self):
+        url = reverse('carsmodel-bulk')
+        self.client.force_login(self.user_1)
+        data = '{"label": "Lada", "model": "Vesta"}\n\n{"label": "Subaru", "model": "Forester"}\n'
+
+        with mock.patch.object(CarsAPIViewSet, 'bulk_batch_size', 1):
+            response = self.client.post(url, data=data, content_type='application/x-ndjson')
+
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(2, response.data['created'])
+        self.assertEqual(5, CarsModel.objects.count())
+
+        response = self.client.post(url, data='{"label": "Lada"}\n{oops', content_type='application/x-ndjson')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_bulk_wrong(self):
+        url = reverse('carsmodel-bulk')
+        data = json.dumps([{'label': 'Mazda', 'model': 'CX-5'}])
+        response = self.client.post(url, data=data, content_type='application/json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        self.client.force_login(self.user_1)
+        response = self.client.post(url, data=data, content_type='application/json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        response = self.client.post(url, data=json.dumps({'label': 'Lada'}), content_type='application/json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(3, CarsModel.objects.count())
+
     def test_update(self):
         url = reverse('carsmodel-detail', args=(self.car_1.id,))
         self.client.force_login(self.user_1)
@@ -142,7 +509,8 @@ class CarAPITestCase(APITestCase):
                                  'first_name': self.user_1.first_name,
                                  'last_name': self.user_1.last_name
                              }
-                         ]
+                         ],
+                         'customers_count': 1,
                          }
 
         self.assertEqual(expected_data, response.data)
@@ -226,11 +594,291 @@ class CarAPITestCase(APITestCase):
                                  'first_name': self.user_1.first_name,
                                  'last_name': self.user_1.last_name
                              }
-                         ]}
+                         ],
+                         'customers_count': 1}
 
         self.assertEqual(expected_data, response.data)
 
 
+class CarsCacheTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user_1 = User.objects.create(username='user_1')
+        self.label_1 = LabelsModel.objects.create(name='Lada')
+        self.car_1 = CarsModel.objects.create(label=self.label_1, model='Granta', year_of_release=2008,
+                                              owner=self.user_1, price=100000)
+        self.car_2 = CarsModel.objects.create(label=self.label_1, model='Vesta', year_of_release=2020,
+                                              owner=self.user_1, price=900000)
+
+    def test_list(self):
+        url = reverse('carsmodel-list')
+        response = self.client.get(url, data={'ordering': 'price', 'page_size': 5})
+        self.assertEqual('MISS', response['X-Cache'])
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(url, data={'page_size': 5, 'ordering': 'price'})
+        self.assertEqual('HIT', cached['X-Cache'])
+        self.assertEqual(0, len(queries))
+        self.assertEqual(response.data, cached.data)
+
+        UserCarsRelation.objects.create(car=self.car_1, user=self.user_1, like=True)
+        response = self.client.get(url, data={'ordering': 'price', 'page_size': 5})
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(1, response.data['results'][0]['likes_count'])
+
+        LabelsModel.objects.create(name='Kia')
+        response = self.client.get(url, data={'ordering': 'price', 'page_size': 5})
+        self.assertEqual('MISS', response['X-Cache'])
+
+    def test_detail(self):
+        url_1 = reverse('carsmodel-detail', args=(self.car_1.id,))
+        url_2 = reverse('carsmodel-detail', args=(self.car_2.id,))
+        self.client.get(url_1)
+        self.client.get(url_2)
+
+        self.car_1.price = 150000
+        self.car_1.save()
+
+        response = self.client.get(url_1)
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(150000, response.data['price'])
+        self.assertEqual('HIT', self.client.get(url_2)['X-Cache'])
+
+    def test_timeout_setting(self):
+        url = reverse('carsmodel-list')
+        # 0 — запись сразу истекает; настройка должна читаться при записи, а не при импорте
+        with override_settings(CARS_CACHE_TIMEOUT=0):
+            self.client.get(url)
+            self.assertEqual('MISS', self.client.get(url)['X-Cache'])
+        self.assertEqual('MISS', self.client.get(url)['X-Cache'])
+        self.assertEqual('HIT', self.client.get(url)['X-Cache'])
+
+    def test_authenticated(self):
+        self.client.force_login(self.user_1)
+        url = reverse('carsmodel-list')
+        self.client.get(url)
+        self.assertFalse(self.client.get(url).has_header('X-Cache'))
+
+    def test_stats(self):
+        url = reverse('carsmodel-list')
+        self.client.get(url)
+        self.client.get(url)
+
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        response = self.client.get(reverse('carsmodel-cache-stats'))
+        self.assertEqual({'hits': 1, 'misses': 1, 'hit_ratio': 0.5}, response.data)
+
+
+class FacetsAPITestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='user_1')
+        for name in ('Lada', 'Toyota', 'Kia'):
+            LabelsModel.objects.create(name=name)
+        cars = (
+            ('Lada', 'Granta', 2008, 100000, 's', 'f', 'm'),
+            ('Lada', 'Niva', 2012, 300000, 'u', 'a', 'm'),
+            ('Toyota', 'Camry', 2020, 1500000, 's', 'f', 'a'),
+            ('Toyota', 'RAV4', 2019, 2000000, 'u', 'a', 'a'),
+            ('Kia', 'Rio', 2016, 700000, 's', 'f', 'a'),
+        )
+        for label, model, year, price, body_type, drive_type, transmission_type in cars:
+            CarsModel.objects.create(label_id=label, model=model, year_of_release=year, price=price, owner=self.user,
+                                     body_type=body_type, drive_type=drive_type, transmission_type=transmission_type)
+        self.url = reverse('carsmodel-facets')
+
+    def counts(self, items, key='value'):
+        return {item[key]: item['count'] for item in items}
+
+    def test_all(self):
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(5, response.data['count'])
+        self.assertEqual([{'value': 'Lada', 'count': 2}, {'value': 'Toyota', 'count': 2}, {'value': 'Kia', 'count': 1}],
+                         response.data['label'])
+        self.assertEqual([{'value': 's', 'name': 'Седан', 'count': 3}, {'value': 'u', 'name': 'Универсал', 'count': 2}],
+                         response.data['body_type'])
+        self.assertEqual({'f': 3, 'a': 2}, self.counts(response.data['drive_type']))
+        self.assertEqual({'a': 3, 'm': 2}, self.counts(response.data['transmission_type']))
+        self.assertEqual([{'from': 2020, 'to': 2024, 'count': 1}, {'from': 2015, 'to': 2019, 'count': 2},
+                          {'from': 2010, 'to': 2014, 'count': 1}, {'from': 2005, 'to': 2009, 'count': 1}],
+                         response.data['year'])
+
+    def test_filters(self):
+        response = self.client.get(self.url, data={'label': 'Lada', 'body_type': 's', 'price__lte': 1600000})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, response.data['count'])
+        # свой фильтр фасет не учитывает: рядом с выбранной маркой видны остальные
+        self.assertEqual({'Lada': 1, 'Kia': 1, 'Toyota': 1}, self.counts(response.data['label']))
+        self.assertEqual({'s': 1, 'u': 1}, self.counts(response.data['body_type']))
+        self.assertEqual({'f': 1}, self.counts(response.data['drive_type']))
+        self.assertEqual({2005: 1}, self.counts(response.data['year'], key='from'))
+
+        response = self.client.get(self.url, data={'year_of_release__gte': 2015, 'search': 'Camry'})
+        self.assertEqual(1, response.data['count'])
+        self.assertEqual({'Toyota': 1}, self.counts(response.data['label']))
+
+    def test_counts_table(self):
+        # без фильтров по другим полям счетчики берутся из CarsFacetCount, а не из объявлений
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, data={'label': 'Lada', 'year_of_release__gte': 2010})
+        self.assertEqual(1, response.data['count'])
+        sql = [query['sql'] for query in queries.captured_queries if 'GROUPING' in query['sql']]
+        self.assertEqual(1, len(sql))
+        self.assertIn('Car_carsfacetcount', sql[0])
+        self.assertNotIn('Car_carsmodel', sql[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, data={'label': 'Lada', 'price__gte': 200000})
+        self.assertEqual(1, response.data['count'])
+        sql = [query['sql'] for query in queries.captured_queries if 'GROUPING' in query['sql']]
+        self.assertIn('Car_carsmodel', sql[0])
+
+    def test_wrong(self):
+        response = self.client.get(self.url, data={'body_type': 'x'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_cache(self):
+        response = self.client.get(self.url, data={'label': ['Lada', 'Kia'], 'ordering': 'price'})
+        self.assertEqual('MISS', response['X-Cache'])
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url, data={'label': ['Kia', 'Lada'], 'cursor': 'x'})
+        self.assertEqual('HIT', cached['X-Cache'])
+        self.assertFalse([query for query in queries if 'Car_carsmodel' in query['sql']])
+        self.assertEqual(response.data, cached.data)
+
+        self.client.force_login(self.user)
+        self.assertEqual('HIT', self.client.get(self.url, data={'label': ['Lada', 'Kia']})['X-Cache'])
+
+        CarsModel.objects.create(label_id='Kia', model='Ceed', owner=self.user)
+        response = self.client.get(self.url, data={'label': ['Lada', 'Kia']})
+        self.assertEqual('MISS', response['X-Cache'])
+        self.assertEqual(4, response.data['count'])
+
+
+class TopListingsAPITestCase(APITestCase):
+    def setUp(self):
+        users = [User.objects.create(username=f'user_{i}') for i in range(3)]
+        label = LabelsModel.objects.create(name='Lada')
+        self.cars = [CarsModel.objects.create(label=label, model=model, owner=users[0])
+                     for model in ('Granta', 'Niva', 'Vesta', 'Priora')]
+        # Niva: два лайка; Vesta и Granta по одному, но у Vesta рейтинг выше; у Priora ничего
+        for user, car, like, rate in ((users[0], 1, True, 4), (users[1], 1, True, None), (users[0], 2, True, 5),
+                                      (users[1], 0, True, 3), (users[2], 3, False, None)):
+            UserCarsRelation.objects.create(user=user, car=self.cars[car], like=like, rate=rate)
+        call_command('refresh_top_listings', stdout=StringIO())
+        self.url = reverse('carsmodel-top')
+
+    def ids(self, response):
+        return [car['id'] for car in response.data]
+
+    def test_top(self):
+        response = self.client.get(self.url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        niva, vesta, granta, priora = self.cars[1], self.cars[2], self.cars[0], self.cars[3]
+        self.assertEqual([niva.id, vesta.id, granta.id, priora.id], self.ids(response))
+        self.assertEqual(CarsSerializer(CarsModel.objects.get(pk=niva.pk)).data, response.data[0])
+
+        response = self.client.get(self.url, data={'limit': 2})
+        self.assertEqual([niva.id, vesta.id], self.ids(response))
+
+    def test_refresh(self):
+        granta = self.cars[0]
+        UserCarsRelation.objects.create(user=User.objects.create(username='user_3'), car=granta, like=True)
+        UserCarsRelation.objects.create(user=User.objects.create(username='user_4'), car=granta, like=True)
+        self.cars[1].delete()
+
+        # до обновления порядок прежний, удаленное объявление пропускается, а поля уже текущие
+        response = self.client.get(self.url)
+        self.assertEqual([self.cars[2].id, granta.id, self.cars[3].id], self.ids(response))
+        self.assertEqual(3, response.data[1]['likes_count'])
+
+        call_command('refresh_top_listings', stdout=StringIO())
+        response = self.client.get(self.url)
+        self.assertEqual([granta.id, self.cars[2].id, self.cars[3].id], self.ids(response))
+
+    def test_home(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([self.cars[1], self.cars[2], self.cars[0], self.cars[3]], list(response.context['top_cars']))
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user_1 = User.objects.create(username='user_1')
+        self.label_1 = LabelsModel.objects.create(name='Lada')
+        self.car_1 = CarsModel.objects.create(label=self.label_1, model='Granta', year_of_release=2008,
+                                              owner=self.user_1, price=100000)
+
+    def test_cars(self):
+        self.client.force_login(self.user_1)
+        url = reverse('carsmodel-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        self.assertFalse([query for query in queries if 'Car_carsmodel' in query['sql']])
+
+        response = self.client.get(url, data={'ordering': 'price'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        self.car_1.price = 150000
+        self.car_1.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_car_last_modified(self):
+        url = reverse('carsmodel-detail', args=(self.car_1.id,))
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+    def test_missing_car(self):
+        # версия карточки не заводится для объявления, которого нет: иначе ключи копились бы без предела
+        missing = CarsModel.objects.order_by('-id').first().id + 1
+        for pk in ('nonexistent0', missing):
+            response = self.client.get(reverse('carsmodel-detail', args=(pk,)))
+            self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+            self.assertFalse(response.has_header('ETag'))
+            self.assertEqual({}, get_cache().get_many([f'cars:version:{pk}', f'cars:version:{pk}:modified']))
+
+        response = self.client.get(reverse('carsmodel-detail', args=(self.car_1.id,)))
+        self.assertTrue(response.has_header('ETag'))
+        self.assertIsNotNone(get_cache().get(f'cars:version:{self.car_1.id}'))
+
+    def test_labels(self):
+        url = reverse('labelsmodel-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        LabelsModel.objects.create(name='Kia')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(['Kia', 'Lada'], [label['name'] for label in response.data])
+
+    @override_settings(CARS_CACHE_ALLOW_LOCAL=False)
+    def test_local_cache(self):
+        # версия в памяти одного воркера не сбросится записью в другом: ни ETag, ни кэша ответов
+        url = reverse('carsmodel-list')
+        for _ in range(2):
+            response = self.client.get(url)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            self.assertFalse(response.has_header('ETag'))
+            self.assertFalse(response.has_header('X-Cache'))
+            self.assertEqual('MISS', self.client.get(reverse('carsmodel-facets'))['X-Cache'])
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}):
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('ETag'))
+            self.assertEqual('HIT', self.client.get(url)['X-Cache'])
+
+
 class UserCarRelationAPITestCase(APITestCase):
     def setUp(self):
         self.user_1 = User.objects.create(username='loh', password=123)
@@ -275,6 +923,32 @@ class UserCarRelationAPITestCase(APITestCase):
         self.assertTrue(relation.like)
         self.assertEqual(5, relation.rate)
 
+    def test_bulk(self):
+        url = reverse('usercarsrelation-bulk')
+        data = [
+            {'user': self.user_1.id, 'car': self.car_2.id, 'like': True, 'rate': 5},
+            {'user': self.user_2.id, 'car': self.car_2.id, 'like': False, 'rate': 2},
+            {'user': self.user_2.id, 'car': self.car_2.id, 'like': True, 'rate': 4},
+            {'user': self.user_2.id, 'car': 0, 'like': True, 'rate': 4},
+            {'user': self.user_2.id, 'car': self.car_1.id, 'like': True, 'rate': 7},
+        ]
+        json_data = json.dumps(data)
+
+        self.client.force_login(self.user_1)
+        response = self.client.post(url, data=json_data, content_type='application/json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.post(url, data=json_data, content_type='application/json')
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(3, response.data['applied'])
+        self.assertEqual([3, 4], [error['row'] for error in response.data['errors']])
+        self.assertIn('rate', response.data['errors'][1]['errors'])
+        self.car_2.refresh_from_db()
+        self.assertEqual((2, '4.50', 2), (self.car_2.likes_count, str(self.car_2.rating), self.car_2.customers_count))
+
 
 class LabelsApiTestCase(APITestCase):
     def setUp(self):
@@ -0,0 +1,83 @@
+import json
+import random
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Avg, Count, DecimalField, Q
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from Car.models import CarsModel, LabelsModel, UserCarsRelation
+
+
+class ConcurrentRatingTestCase(TransactionTestCase):
+    """Параллельные оценки, удаления оценок и правки владельца одного объявления."""
+    raters = 8
+    rounds = 15
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.users = [User.objects.create(username=f'rater_{i}') for i in range(self.raters)]
+        self.car = CarsModel.objects.create(label=LabelsModel.objects.create(name='Lada'), model='Granta',
+                                            owner=self.owner, price=100000)
+        self.barrier = threading.Barrier(self.raters * 2 + 1)
+        self.errors = []
+
+    def run_thread(self, target, *args):
+        try:
+            self.barrier.wait()
+            target(*args)
+        except Exception as exc:
+            self.errors.append(exc)
+        finally:
+            connection.close()
+
+    def rate(self, user, seed):
+        rng = random.Random(seed)
+        client = APIClient()
+        client.force_authenticate(user)
+        url = reverse('usercarsrelation-detail', args=(self.car.id,))
+        for _ in range(self.rounds):
+            if rng.random() < 0.15:
+                UserCarsRelation.objects.filter(user=user, car=self.car).delete()
+                continue
+            data = {'like': rng.random() < 0.5, 'rate': rng.choice((None, 1, 2, 3, 4, 5))}
+            response = client.patch(url, data=json.dumps(data), content_type='application/json')
+            assert response.status_code == status.HTTP_200_OK, response.content
+
+    def edit(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        url = reverse('carsmodel-detail', args=(self.car.id,))
+        for price in range(1, self.rounds + 1):
+            response = client.patch(url, data=json.dumps({'price': price, 'description': f'Правка {price}'}),
+                                    content_type='application/json')
+            assert response.status_code == status.HTTP_200_OK, response.content
+
+    def test_stress(self):
+        # по два потока на пользователя: они меняют одну и ту же строку отношения
+        threads = [threading.Thread(target=self.run_thread, args=(self.rate, user, seed))
+                   for seed, user in enumerate(self.users * 2)]
+        threads.append(threading.Thread(target=self.run_thread, args=(self.edit,)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], self.errors)
+
+        self.car.refresh_from_db()
+        expected = UserCarsRelation.objects.filter(car=self.car).aggregate(
+            rating=Avg('rate', output_field=DecimalField()), rating_count=Count('rate'),
+            likes_count=Count('pk', filter=Q(like=True)), customers_count=Count('pk'))
+        self.assertEqual(expected['rating_count'], self.car.rating_count)
+        self.assertEqual(expected['likes_count'], self.car.likes_count)
+        self.assertEqual(expected['customers_count'], self.car.customers_count)
+        if expected['rating'] is None:
+            self.assertIsNone(self.car.rating)
+        else:
+            self.assertEqual(expected['rating'].quantize(Decimal('0.01'), ROUND_HALF_UP), self.car.rating)
+        self.assertEqual((self.rounds, f'Правка {self.rounds}'), (self.car.price, self.car.description))
@@ -0,0 +1,56 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from Car.management.commands.bench_connections import make_connection
+from rest_api.db import check_connection
+from rest_api.db.pooled.base import DatabaseWrapper as PooledDatabaseWrapper
+
+
+class ConnectionTestCase(TestCase):
+    def tearDown(self):
+        PooledDatabaseWrapper.close_pools()
+
+    def terminate(self, wrapper):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [wrapper.connection.get_backend_pid()])
+
+    def test_health_check(self):
+        wrapper = make_connection('django.db.backends.postgresql', 600, True)
+        wrapper.ensure_connection()
+        check_connection(wrapper)
+        self.assertIsNotNone(wrapper.connection)
+
+        # база разорвала постоянное соединение: проверка закрывает его, и следующий запрос открывает новое
+        self.terminate(wrapper)
+        check_connection(wrapper)
+        self.assertIsNone(wrapper.connection)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        wrapper.close()
+
+    def test_pool_reuses_connection(self):
+        wrapper = make_connection('rest_api.db.pooled', 0, True)
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertFalse(raw.closed)
+
+        wrapper.ensure_connection()
+        self.assertIs(raw, wrapper.connection)
+
+        # соединение в пуле умерло: при выдаче оно заменяется новым
+        self.terminate(wrapper)
+        wrapper.close()
+        wrapper.ensure_connection()
+        self.assertIsNot(raw, wrapper.connection)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        wrapper.close()
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_connections', '--requests', '5', stdout=out)
+        self.assertIn('persistent+health', out.getvalue())
@@ -1,9 +1,24 @@
+import datetime
+import json
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command, CommandError
+from django.test import TestCase, TransactionTestCase, override_settings
 
-from Car.logic import set_rating
+from Car.choices import current_year, validate_year
+from Car.logic import insert_cars, set_rating, upsert_relations
+from Car.recompute import RecomputeWorker
 
-from Car.models import LabelsModel, CarsModel, UserCarsRelation
+from Car.models import LabelsModel, CarsFacetCount, CarsModel, RatingQueue, UserCarsRelation
+from Car.seed import seed_cars
 
 
 class SetRatingTestCase(TestCase):
@@ -26,4 +41,388 @@ class SetRatingTestCase(TestCase):
     def test_ok(self):
         set_rating(self.car_1)
         self.car_1.refresh_from_db()
-        self.assertEqual('3.33', str(self.car_1.rating))
\ No newline at end of file
+        self.assertEqual('3.33', str(self.car_1.rating))
+
+
+class RatingCountersTestCase(TestCase):
+    def setUp(self):
+        self.user_1 = User.objects.create(username='user_1')
+        self.user_2 = User.objects.create(username='user_2')
+        label_1 = LabelsModel.objects.create(name='Lada')
+        self.car_1 = CarsModel.objects.create(label=label_1, model='Granta', year_of_release=2008,
+                                              owner=self.user_1, price=250000)
+
+    def test_create(self):
+        UserCarsRelation.objects.create(user=self.user_1, car=self.car_1, rate=2)
+        UserCarsRelation.objects.create(user=self.user_2, car=self.car_1, rate=5)
+        self.car_1.refresh_from_db()
+        self.assertEqual(7, self.car_1.rating_sum)
+        self.assertEqual(2, self.car_1.rating_count)
+        self.assertEqual('3.50', str(self.car_1.rating))
+
+    def test_change(self):
+        relation = UserCarsRelation.objects.create(user=self.user_1, car=self.car_1, like=True)
+        self.car_1.refresh_from_db()
+        self.assertEqual(0, self.car_1.rating_count)
+        self.assertIsNone(self.car_1.rating)
+
+        relation.rate = 4
+        relation.save()
+        relation.rate = 1
+        relation.save()
+        self.car_1.refresh_from_db()
+        self.assertEqual(1, self.car_1.rating_sum)
+        self.assertEqual(1, self.car_1.rating_count)
+        self.assertEqual('1.00', str(self.car_1.rating))
+
+        relation = UserCarsRelation.objects.get(pk=relation.pk)
+        relation.rate = None
+        relation.save()
+        self.car_1.refresh_from_db()
+        self.assertEqual(0, self.car_1.rating_count)
+        self.assertIsNone(self.car_1.rating)
+
+    def test_delete(self):
+        UserCarsRelation.objects.create(user=self.user_1, car=self.car_1, rate=2)
+        UserCarsRelation.objects.create(user=self.user_2, car=self.car_1, rate=3)
+        UserCarsRelation.objects.filter(user=self.user_2).delete()
+        self.car_1.refresh_from_db()
+        self.assertEqual(2, self.car_1.rating_sum)
+        self.assertEqual(1, self.car_1.rating_count)
+        self.assertEqual('2.00', str(self.car_1.rating))
+
+    def test_rebuild_command(self):
+        UserCarsRelation.objects.create(user=self.user_1, car=self.car_1, rate=2)
+        UserCarsRelation.objects.create(user=self.user_2, car=self.car_1, rate=3)
+        CarsModel.objects.update(rating_sum=0, rating_count=0, rating=None)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_ratings', '--check', stdout=StringIO())
+
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.car_1.refresh_from_db()
+        self.assertEqual(5, self.car_1.rating_sum)
+        self.assertEqual(2, self.car_1.rating_count)
+        self.assertEqual('2.50', str(self.car_1.rating))
+
+    def test_rebuild_check_sum(self):
+        UserCarsRelation.objects.create(user=self.user_1, car=self.car_1, rate=2)
+        UserCarsRelation.objects.create(user=self.user_2, car=self.car_1, rate=3)
+        call_command('rebuild_ratings', '--check', stdout=StringIO())
+
+        # rating и rating_count верны, разошлась только сумма
+        CarsModel.objects.filter(id=self.car_1.id).update(rating_sum=7)
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_ratings', '--check', stdout=out)
+        self.assertIn(f'{self.car_1.id}: rating=2.50 (7/2)', out.getvalue())
+
+
+class LikesCounterTestCase(TestCase):
+    def setUp(self):
+        self.user_1 = User.objects.create(username='user_1')
+        self.user_2 = User.objects.create(username='user_2')
+        label_1 = LabelsModel.objects.create(name='Lada')
+        self.car_1 = CarsModel.objects.create(label=label_1, model='Granta', year_of_release=2008,
+                                              owner=self.user_1, price=250000)
+
+    def test_toggle(self):
+        relation = UserCarsRelation.objects.create(user=self.user_1, car=self.car_1, like=True)
+        UserCarsRelation.objects.create(user=self.user_2, car=self.car_1, like=True, rate=3)
+        self.car_1.refresh_from_db()
+        self.assertEqual(2, self.car_1.likes_count)
+
+        relation.like = False
+        relation.save()
+        relation.save()
+        self.car_1.refresh_from_db()
+        self.assertEqual(1, self.car_1.likes_count)
+
+        UserCarsRelation.objects.filter(user=self.user_2).delete()
+        self.car_1.refresh_from_db()
+        self.assertEqual(0, self.car_1.likes_count)
+        self.assertEqual(1, self.car_1.customers_count)
+
+    def test_deferred_fields(self):
+        UserCarsRelation.objects.create(user=self.user_1, car=self.car_1, like=True, rate=4)
+        self.assertEqual(4, UserCarsRelation.objects.only('id').get().rate)
+        self.assertTrue(UserCarsRelation.objects.defer('rate').get().like)
+
+        relation = UserCarsRelation.objects.only('id', 'car_id').get()
+        relation.like = False
+        relation.save()
+        self.car_1.refresh_from_db()
+        self.assertEqual(0, self.car_1.likes_count)
+        self.assertEqual(4, self.car_1.rating_sum)
+
+    def test_rebuild_command(self):
+        UserCarsRelation.objects.create(user=self.user_1, car=self.car_1, like=True)
+        CarsModel.objects.update(likes_count=5, customers_count=3)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_likes', '--check', stdout=StringIO())
+
+        call_command('rebuild_likes', stdout=StringIO())
+        self.car_1.refresh_from_db()
+        self.assertEqual(1, self.car_1.likes_count)
+        self.assertEqual(1, self.car_1.customers_count)
+
+
+class FacetCountsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user_1')
+        LabelsModel.objects.create(name='Lada')
+        LabelsModel.objects.create(name='Kia')
+        self.car = CarsModel.objects.create(label_id='Lada', model='Granta', year_of_release=2008, owner=self.user)
+
+    def counts(self):
+        return {row[:-1]: row[-1] for row in CarsFacetCount.objects.exclude(cars_count=0)
+                .values_list(*CarsModel.facet_fields, 'cars_count')}
+
+    def test_changes(self):
+        CarsModel.objects.create(label_id='Lada', model='Niva', year_of_release=2008, owner=self.user)
+        self.assertEqual({('Lada', 's', 'f', 'm', 2008): 2}, self.counts())
+
+        self.car.label_id, self.car.body_type = 'Kia', 'h'
+        self.car.save()
+        self.car.save()
+        self.assertEqual({('Lada', 's', 'f', 'm', 2008): 1, ('Kia', 'h', 'f', 'm', 2008): 1}, self.counts())
+
+        # сохранение только других полей счетчик не трогает
+        self.car.price = 100000
+        self.car.save(update_fields=['price'])
+        self.car.delete()
+        self.assertEqual({('Lada', 's', 'f', 'm', 2008): 1}, self.counts())
+
+        self.user.delete()
+        self.assertEqual({}, self.counts())
+        call_command('rebuild_facets', '--check', stdout=StringIO())
+
+    def test_seed(self):
+        seed_cars(100)
+        call_command('rebuild_facets', '--check', stdout=StringIO())
+
+    def test_rebuild_command(self):
+        CarsFacetCount.objects.update(cars_count=5)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_facets', '--check', stdout=StringIO())
+
+        call_command('rebuild_facets', stdout=StringIO())
+        self.assertEqual({('Lada', 's', 'f', 'm', 2008): 1}, self.counts())
+
+
+class InsertCarsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user_1')
+        self.labels = {name: LabelsModel.objects.create(name=name) for name in ('Lada', 'Kia')}
+
+    def test_matches_create(self):
+        rows = [
+            {'label': self.labels['Lada'], 'model': 'Granta', 'description': 'Кавычки " и \\ и {скобки}, запятая'},
+            {'label': self.labels['Kia'], 'model': 'Rio', 'price': 700000, 'engine_capacity': Decimal('1.6'),
+             'year_of_release': 2016, 'body_type': 'h', 'description': None},
+            {'label': self.labels['Kia'], 'model': 'NULL', 'description': ''},
+        ]
+        ids = insert_cars(rows, self.user, batch_size=2)
+        created = [CarsModel.objects.create(owner=self.user, **row).id for row in rows]
+        expected = CarsModel.objects.filter(id__in=created).order_by('id')
+
+        # search_vector тоже сравнивается: в INSERT он должен получиться тем же, что и при save()
+        fields = [field.attname for field in CarsModel._meta.concrete_fields if field.attname not in ('id', 'date')]
+        inserted = CarsModel.objects.filter(id__in=ids).order_by('id')
+        self.assertEqual([[getattr(car, name) for name in fields] for car in expected],
+                         [[getattr(car, name) for name in fields] for car in inserted])
+        call_command('rebuild_facets', '--check', stdout=StringIO())
+
+    def test_same_rows(self):
+        ids = insert_cars([{'label': self.labels['Lada'], 'model': 'Niva'}] * 3, self.user)
+        self.assertEqual(3, CarsModel.objects.filter(id__in=ids, model='Niva', owner=self.user).count())
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_bulk', '--rows', '20', '--repeat', '1', stdout=out)
+        self.assertIn('target', out.getvalue())
+        self.assertFalse(CarsModel.objects.exists())
+
+
+class UpsertRelationsTestCase(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user_{i}') for i in range(6)]
+        label_1 = LabelsModel.objects.create(name='Lada')
+        self.row_cars = [CarsModel.objects.create(label=label_1, model='Granta') for _ in range(4)]
+        self.bulk_cars = [CarsModel.objects.create(label=label_1, model='Granta') for _ in range(4)]
+
+    def events(self):
+        rng = random.Random(1)
+        return [(rng.randrange(len(self.users)), rng.randrange(len(self.row_cars)),
+                 rng.random() < 0.5, rng.choice((None, 1, 2, 3, 4, 5))) for _ in range(200)]
+
+    def test_matches_save(self):
+        events = self.events()
+        for user, car, like, rate in events:
+            relation, _ = UserCarsRelation.objects.get_or_create(user=self.users[user], car=self.row_cars[car])
+            relation.like, relation.rate = like, rate
+            relation.save()
+
+        car_ids = upsert_relations([(self.users[user].pk, self.bulk_cars[car].pk, like, rate)
+                                    for user, car, like, rate in events], batch_size=7)
+
+        self.assertEqual({car.pk for car in self.bulk_cars}, car_ids)
+        fields = ('rating', 'rating_sum', 'rating_count', 'likes_count', 'customers_count')
+        for row_car, bulk_car in zip(self.row_cars, self.bulk_cars):
+            row_car.refresh_from_db()
+            bulk_car.refresh_from_db()
+            self.assertEqual([getattr(row_car, field) for field in fields],
+                             [getattr(bulk_car, field) for field in fields])
+
+    def test_queries(self):
+        relations = [(user.pk, car.pk, True, 4) for user in self.users for car in self.bulk_cars]
+        # точка сохранения, вставка, пересчет рейтинга, пересчет лайков, освобождение точки
+        with self.assertNumQueries(5):
+            upsert_relations(relations)
+        self.bulk_cars[0].refresh_from_db()
+        self.assertEqual(6, self.bulk_cars[0].likes_count)
+
+    def test_command(self):
+        user, car = self.users[0], self.bulk_cars[0]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write(json.dumps({'user': user.pk, 'car': car.pk, 'like': True, 'rate': 5}) + '\n')
+            file.write(json.dumps({'user': user.pk, 'car': 0, 'like': True, 'rate': 5}) + '\n')
+            file.flush()
+            out = StringIO()
+            call_command('apply_relations', file.name, stdout=out)
+
+        self.assertIn('Применено отношений: 1, с ошибками: 1', out.getvalue())
+        car.refresh_from_db()
+        self.assertEqual((1, '5.00'), (car.likes_count, str(car.rating)))
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write(f'user,car,like,rate\n{user.pk},{car.pk},false,\n')
+            file.flush()
+            call_command('apply_relations', file.name, stdout=StringIO())
+
+        car.refresh_from_db()
+        self.assertEqual((0, None, 1), (car.likes_count, car.rating, car.customers_count))
+
+
+@contextmanager
+def shared_cache():
+    # кэш в файлах виден всем процессам, как Redis
+    with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}):
+        yield
+
+
+class DeferredRecomputeTestCase(TestCase):
+    def setUp(self):
+        self.user_1 = User.objects.create(username='user_1')
+        self.user_2 = User.objects.create(username='user_2')
+        label_1 = LabelsModel.objects.create(name='Lada')
+        self.car_1 = CarsModel.objects.create(label=label_1, model='Granta', owner=self.user_1)
+
+    def rate(self):
+        UserCarsRelation.objects.create(user=self.user_1, car=self.car_1, like=True, rate=2)
+        relation = UserCarsRelation.objects.create(user=self.user_2, car=self.car_1, rate=5)
+        relation.rate = 3
+        relation.save()
+
+    def assertCounters(self, rating, rating_count, likes_count):
+        self.car_1.refresh_from_db()
+        self.assertEqual((rating, rating_count, likes_count),
+                         (self.car_1.rating and str(self.car_1.rating), self.car_1.rating_count,
+                          self.car_1.likes_count))
+
+    @override_settings(CARS_RATING_MODE='queue')
+    def test_queue_local_cache(self):
+        # отдельный процесс очереди не сбросил бы версии в памяти веб-воркеров
+        with self.assertRaises(ImproperlyConfigured):
+            self.rate()
+        with self.assertRaises(CommandError):
+            call_command('process_rating_queue', '--once', stdout=StringIO())
+
+    @override_settings(CARS_RATING_MODE='queue')
+    def test_queue(self):
+        with shared_cache():
+            self.rate()
+            self.assertCounters(None, 0, 0)
+            self.assertEqual(3, RatingQueue.objects.filter(car_id=self.car_1.id).count())
+
+            call_command('process_rating_queue', '--once', stdout=StringIO())
+
+        self.assertCounters('2.50', 2, 1)
+        self.assertFalse(RatingQueue.objects.exists())
+
+    @override_settings(CARS_RATING_MODE='thread')
+    def test_thread(self):
+        worker = RecomputeWorker()
+        with mock.patch('Car.recompute.worker', worker), mock.patch('Car.recompute.threading.Thread'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.rate()
+        self.assertEqual({self.car_1.id}, worker.pending)
+        self.assertCounters(None, 0, 0)
+
+        self.assertEqual(1, worker.flush())
+        self.assertCounters('2.50', 2, 1)
+
+    @override_settings(CARS_RATING_MODE='queue')
+    def test_delete_car(self):
+        with shared_cache():
+            self.rate()
+            self.car_1.delete()
+            call_command('process_rating_queue', '--once', stdout=StringIO())
+        self.assertFalse(RatingQueue.objects.exists())
+
+
+@override_settings(CARS_RATING_MODE='thread', CARS_RATING_WINDOW=0.05)
+class RecomputeThreadTestCase(TransactionTestCase):
+    def test_worker(self):
+        user_1 = User.objects.create(username='user_1')
+        car_1 = CarsModel.objects.create(label=LabelsModel.objects.create(name='Lada'), model='Granta')
+
+        worker = RecomputeWorker()
+        with mock.patch('Car.recompute.worker', worker):
+            UserCarsRelation.objects.create(user=user_1, car=car_1, like=True, rate=4)
+            for _ in range(100):
+                car_1.refresh_from_db()
+                if car_1.rating_count:
+                    break
+                time.sleep(0.05)
+
+        self.assertEqual((1, 1, '4.00'), (car_1.rating_count, car_1.likes_count, str(car_1.rating)))
+
+
+class BenchApiTestCase(TestCase):
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as file:
+            call_command('bench_api', '--cars', '50', '--users', '10', '--requests', '5', '--warmup', '1',
+                         '--output', file.name, stdout=StringIO())
+            result = json.load(file)
+
+        self.assertEqual({'list', 'search', 'filter', 'ordering', 'facets', 'top', 'detail', 'rate', 'labels', 'label'},
+                         set(result['scenarios']))
+        for name, scenario in result['scenarios'].items():
+            self.assertEqual(0, scenario['errors'], name)
+            self.assertLessEqual(scenario['p50_ms'], scenario['p99_ms'])
+        # данные создавались в транзакции и откатились
+        self.assertFalse(CarsModel.objects.exists())
+
+    def test_concurrency_requires_url(self):
+        with self.assertRaises(CommandError):
+            call_command('bench_api', '--concurrency', '4', stdout=StringIO())
+
+
+class MigrationsTestCase(TestCase):
+    def test_year_is_callable(self):
+        # в миграцию попадает ссылка на функцию, а не год на момент makemigrations
+        field = CarsModel._meta.get_field('year_of_release')
+        self.assertIs(current_year, field.default)
+        self.assertIn(validate_year, field.validators)
+
+    def test_no_pending_changes(self):
+        # значения по умолчанию и валидаторы не должны порождать новую миграцию при смене года
+        with mock.patch('Car.choices.datetime') as patched:
+            patched.date.today.return_value = datetime.date(2100, 1, 1)
+            self.assertEqual(2100, current_year())
+            call_command('makemigrations', 'Car', '--check', '--dry-run', stdout=StringIO())
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from Car import metrics
+from Car.cache import get_cache
+from Car.models import CarsModel, LabelsModel
+
+
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        metrics.registry.reset()
+        self.user = User.objects.create(username='user_1')
+        self.car = CarsModel.objects.create(label=LabelsModel.objects.create(name='Lada'), model='Granta',
+                                            owner=self.user)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_access(self):
+        url = reverse('metrics')
+        self.assertEqual(404, self.client.get(url, REMOTE_ADDR='10.0.0.1').status_code)
+        self.client.force_login(self.user)
+        self.assertEqual(404, self.client.get(url, REMOTE_ADDR='10.0.0.1').status_code)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(200, self.client.get(url, REMOTE_ADDR='10.0.0.1').status_code)
+
+        self.client.logout()
+        with self.settings(CARS_METRICS_ALLOWED_IPS=['10.0.0.0/24']):
+            self.assertEqual(200, self.client.get(url, REMOTE_ADDR='10.0.0.1').status_code)
+            self.assertEqual(404, self.client.get(url, REMOTE_ADDR='10.0.1.1').status_code)
+
+    def test_routes(self):
+        self.client.get(reverse('carsmodel-list'))
+        self.client.get(reverse('carsmodel-list'))
+        self.client.get(reverse('carsmodel-detail', args=(self.car.id,)))
+        self.client.get(reverse('labelsmodel-list'))
+        text = self.scrape()
+
+        self.assertIn('# TYPE cars_http_request_duration_seconds histogram', text)
+        self.assertIn('cars_http_request_duration_seconds_count{method="GET",route="carsmodel-list"} 2', text)
+        self.assertIn('cars_http_request_duration_seconds_bucket{method="GET",route="carsmodel-list",le="+Inf"} 2',
+                      text)
+        self.assertIn('cars_http_request_duration_seconds_count{method="GET",route="carsmodel-detail"} 1', text)
+        self.assertIn('cars_http_requests_total{method="GET",route="labelsmodel-list",status="200"} 1', text)
+        self.assertIn('cars_cache_requests_total{result="hit"} 1', text)
+        self.assertIn('cars_cache_requests_total{result="miss"} 2', text)
+        self.assertIn('cars_db_queries_total{route="carsmodel-list"}', text)
+        self.assertIn('cars_db_connections{scope="database",state="active"}', text)
+
+    def test_rating_updates(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('usercarsrelation-detail', args=(self.car.id,))
+        self.client.patch(url, data={'like': True, 'rate': 5}, format='json')
+        self.client.patch(url, data={'rate': 3}, format='json')
+        text = self.scrape()
+
+        self.assertIn('cars_http_request_duration_seconds_count{method="PATCH",route="usercarsrelation-detail"} 2',
+                      text)
+        # первый запрос создает отношение и затем ставит оценку: три сдвига счетчиков
+        self.assertIn('cars_rating_updates_total{kind="delta"} 3', text)
+        self.assertIn('cars_rating_update_duration_seconds_count{kind="delta"} 3', text)
+
+    def test_multiprocess(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(CARS_METRICS_DIR=directory):
+            other = {'counters': [['cars_rating_updates_total', [['kind', 'rebuild']], 7]],
+                     'histograms': [['cars_http_request_duration_seconds',
+                                     [['method', 'GET'], ['route', 'carsmodel-list']],
+                                     [0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1], 0.5, 4]]}
+            with open(os.path.join(directory, 'metrics-999999.json'), 'w') as file:
+                json.dump(other, file)
+
+            self.client.get(reverse('carsmodel-list'))
+            self.assertTrue(os.path.exists(metrics.registry.path(directory)))
+            text = self.scrape()
+
+        self.assertIn('cars_rating_updates_total{kind="rebuild"} 7', text)
+        self.assertIn('cars_http_request_duration_seconds_count{method="GET",route="carsmodel-list"} 5', text)
@@ -0,0 +1,135 @@
+import json
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from Car.cache import get_cache
+from Car.logic import upsert_relations
+from Car.models import CarsModel, LabelsModel, UserCarsRelation
+from Car.permissions import IsAuthenticatedOwnerOrReadOnly
+
+
+class QueryCountTestCase(APITestCase):
+    """
+    Число SQL-запросов каждого эндпоинта не зависит от количества строк.
+
+    Данные досоздаются до 1, 10 и 100 объявлений, оценивших и марок; на
+    каждом размере запрос выполняется заново и должен стоить ровно столько же.
+    """
+    sizes = (1, 10, 100)
+
+    def setUp(self):
+        self.owner = User.objects.create(username='owner')
+        self.car = CarsModel.objects.create(label=LabelsModel.objects.create(name='Label 0'), model='Granta',
+                                            owner=self.owner, price=100000)
+        self.users, self.cars, self.labels = [], [self.car], 1
+
+    def seed(self, size):
+        while len(self.users) < size:
+            user = User.objects.create(username=f'user_{len(self.users)}')
+            UserCarsRelation.objects.create(user=user, car=self.car, like=True, rate=len(self.users) % 5 + 1)
+            self.users.append(user)
+        while len(self.cars) < size:
+            car = CarsModel.objects.create(label_id='Label 0', model='Vesta', owner=self.users[len(self.cars)])
+            UserCarsRelation.objects.create(user=self.owner, car=car, like=True, rate=4)
+            self.cars.append(car)
+        while self.labels < size:
+            LabelsModel.objects.create(name=f'Label {self.labels}')
+            self.labels += 1
+
+    def assertQueries(self, expected, request, user=None, status_code=status.HTTP_200_OK, prepare=None):
+        """request(arg) стоит expected запросов на каждом размере; arg — результат prepare(size) или size."""
+        if user is not None:
+            self.client.force_authenticate(user)
+        for size in self.sizes:
+            self.seed(size)
+            arg = prepare(size) if prepare else size
+            get_cache().clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = request(arg)
+            self.assertEqual(status_code, response.status_code, response.data)
+            sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+            self.assertEqual(expected, len(queries), f'{size} строк:\n{sql}')
+
+    def test_cars_list(self):
+        url = reverse('carsmodel-list')
+        self.assertQueries(2, lambda size: self.client.get(url, {'page_size': 100}))
+
+    def test_cars_list_authenticated(self):
+        url = reverse('carsmodel-list')
+        self.assertQueries(2, lambda size: self.client.get(url, {'page_size': 100}), user=self.owner)
+
+    def test_cars_list_expand(self):
+        url = reverse('carsmodel-list')
+        self.assertQueries(2, lambda size: self.client.get(url, {'page_size': 100, 'expand': 'customers'}))
+
+    def test_cars_detail(self):
+        url = reverse('carsmodel-detail', args=(self.car.id,))
+        # кэш пуст: версия карточки заводится только после проверки, что объявление существует;
+        # дальше, пока версия жива, карточка снова стоит 2 запроса
+        self.assertQueries(3, lambda size: self.client.get(url))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'nocache': 1})
+        self.assertEqual(2, len(queries))
+
+    def test_cars_facets(self):
+        url = reverse('carsmodel-facets')
+        self.assertQueries(1, lambda size: self.client.get(url, {'label': 'Label 0', 'price__gte': 1}))
+
+    def test_cars_top(self):
+        url = reverse('carsmodel-top')
+        # рейтинг вместе с объявлениями и первые оценившие
+        self.assertQueries(2, lambda size: self.client.get(url, {'limit': 100}),
+                           prepare=lambda size: call_command('refresh_top_listings', stdout=StringIO()))
+
+    def test_cars_create(self):
+        url = reverse('carsmodel-list')
+        data = json.dumps({'label': 'Label 0', 'model': 'Priora', 'year_of_release': 2012, 'price': 250000})
+        # INSERT объявления, search_vector и счетчик фасетов
+        self.assertQueries(7, lambda size: self.client.post(url, data=data, content_type='application/json'),
+                           user=self.owner, status_code=status.HTTP_201_CREATED)
+
+    def test_cars_update(self):
+        url = reverse('carsmodel-detail', args=(self.car.id,))
+        # год каждый раз другой: кроме UPDATE, блокировка строки и сдвиг двух счетчиков фасетов
+        self.assertQueries(9, lambda size: self.client.put(url, content_type='application/json', data=json.dumps(
+            {'label': 'Label 0', 'model': 'Priora', 'year_of_release': 2000 + size % 20, 'price': 250000})),
+                           user=self.owner)
+
+    def test_cars_delete(self):
+        def prepare(size):
+            car = CarsModel.objects.create(label_id='Label 0', model='Niva', owner=self.owner)
+            upsert_relations((user.id, car.id, True, 3) for user in self.users)
+            return car
+
+        self.assertQueries(6, lambda car: self.client.delete(reverse('carsmodel-detail', args=(car.id,))),
+                           user=self.owner, status_code=status.HTTP_204_NO_CONTENT, prepare=prepare)
+
+    def test_relation_patch(self):
+        UserCarsRelation.objects.create(user=self.owner, car=self.car)
+        url = reverse('usercarsrelation-detail', args=(self.car.id,))
+        # оценка меняется на каждом размере, иначе счетчики нечего обновлять
+        self.assertQueries(6, lambda size: self.client.patch(
+            url, data={'like': size % 2 == 1, 'rate': self.sizes.index(size) + 1}, format='json'), user=self.owner)
+
+    def test_labels_list(self):
+        url = reverse('labelsmodel-list')
+        self.assertQueries(1, lambda size: self.client.get(url))
+
+    def test_labels_detail(self):
+        url = reverse('labelsmodel-detail', args=('Label 0',))
+        self.assertQueries(1, lambda size: self.client.get(url))
+
+    def test_owner_permission(self):
+        # объявление без select_related('owner'): проверка владельца не должна догружать пользователя
+        car = CarsModel.objects.get(pk=self.car.pk)
+        request = APIRequestFactory().delete('/')
+        request.user = self.owner
+        with self.assertNumQueries(0):
+            self.assertTrue(IsAuthenticatedOwnerOrReadOnly().has_object_permission(request, None, car))
@@ -1,8 +1,7 @@
 from django.contrib.auth.models import User
-from django.db.models import Count, Case, When, Avg
 from django.test import TestCase
 
-from Car.serializers import CarsSerializer, UserCarsRelationSerializer, LabelsSerializer
+from Car.serializers import CarsSerializer, CarsValuesSerializer, UserCarsRelationSerializer, LabelsSerializer
 
 from Car.models import LabelsModel, CarsModel, UserCarsRelation
 
@@ -30,8 +29,7 @@ class CarsSerializerTestCase(TestCase):
         UserCarsRelation.objects.create(user=user_1, car=car_2, like=True)
         UserCarsRelation.objects.create(user=user_2, car=car_2, like=False, rate=2)
 
-        queryset = CarsModel.objects.annotate(
-            likes_count=Count(Case(When(usercarsrelation__like=True, then=1)))).select_related('owner', 'label')\
+        queryset = CarsModel.objects.select_related('owner', 'label')\
             .prefetch_related('customers').order_by('id')
 
         data = CarsSerializer(queryset, many=True).data
@@ -63,7 +61,8 @@ class CarsSerializerTestCase(TestCase):
                         'first_name': user_2.first_name,
                         'last_name': user_2.last_name
                     }
-                ]
+                ],
+                'customers_count': 2,
             },
             {
                 'id': car_2.id,
@@ -90,12 +89,42 @@ class CarsSerializerTestCase(TestCase):
                         'first_name': user_2.first_name,
                         'last_name': user_2.last_name
                     }
-                ]
+                ],
+                'customers_count': 2,
             }
         ]
         self.assertEqual(expected_data, data)
 
 
+class CarsValuesSerializerTestCase(TestCase):
+    def setUp(self):
+        user_1 = User.objects.create(username='user_1', first_name='Альберт', last_name='Имаков')
+        label_1 = LabelsModel.objects.create(name='Lada')
+        self.car_1 = CarsModel.objects.create(label=label_1, model='Granta', year_of_release=2008, owner=user_1,
+                                              price=250000, description='В хорошем состоянии')
+        CarsModel.objects.create(label=label_1, model='Vesta', year_of_release=2018)
+        UserCarsRelation.objects.create(user=user_1, car=self.car_1, like=True, rate=4)
+
+    def test_data(self):
+        queryset = CarsModel.objects.select_related('owner', 'label').order_by('id')
+        serializer = CarsValuesSerializer(context={})
+
+        data = CarsValuesSerializer(queryset.values(*serializer.columns)).data
+
+        self.assertEqual(CarsSerializer(queryset, many=True).data, data)
+
+    def test_fields(self):
+        context = {'fields': ['model', 'owner_name', 'customers']}
+        queryset = CarsModel.objects.select_related('owner').order_by('id')
+        serializer = CarsValuesSerializer(context=context)
+
+        data = CarsValuesSerializer(queryset.values(*serializer.columns), context=context).data
+
+        self.assertEqual(['id', 'model', 'owner__username'], serializer.columns)
+        self.assertEqual(CarsSerializer(queryset, many=True, context=context).data, data)
+        self.assertEqual({'model': 'Vesta', 'owner_name': '', 'customers': []}, data[1])
+
+
 class UserCarsRelationTestCase(TestCase):
     def test_data(self):
         user1 = User.objects.create(username='user1')
@@ -0,0 +1,47 @@
+import json
+import re
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from Car.cache import get_cache
+from Car.models import CarsModel, LabelsModel, UserCarsRelation
+
+
+class RequestTimingMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.user = User.objects.create(username='user_1')
+        car = CarsModel.objects.create(label=LabelsModel.objects.create(name='Lada'), model='Granta', owner=self.user)
+        UserCarsRelation.objects.create(user=self.user, car=car, like=True, rate=5)
+
+    def server_timing(self, response):
+        return {name: (float(duration), desc) for name, duration, desc in
+                re.findall(r'(\w+);dur=([\d.]+)(?:;desc="([^"]*)")?', response['Server-Timing'])}
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('carsmodel-list'))
+        timing = self.server_timing(response)
+
+        self.assertEqual(f'{len(queries)} queries', timing['db'][1])
+        self.assertEqual({'db', 'serializer', 'render', 'total'}, set(timing))
+        self.assertGreater(timing['serializer'][0], 0)
+        self.assertGreater(timing['render'][0], 0)
+        self.assertGreaterEqual(timing['total'][0], timing['db'][0] + timing['render'][0])
+
+    def test_slow_request_log(self):
+        with self.settings(CARS_SLOW_REQUEST_MS=0), self.assertLogs('Car.timing', 'WARNING') as logs:
+            self.client.get(reverse('carsmodel-list'))
+        record = json.loads(logs.records[0].getMessage())
+
+        self.assertEqual(('carsmodel-list', 200), (record['route'], record['status']))
+        self.assertEqual(record['queries'], len(record['slowest_sql']))
+        self.assertIn('Car_carsmodel', ' '.join(query['sql'] for query in record['slowest_sql']))
+
+    def test_fast_request_not_logged(self):
+        with self.assertNoLogs('Car.timing', 'WARNING'):
+            self.client.get(reverse('labelsmodel-list'))
@@ -0,0 +1,147 @@
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """Счетчики одного запроса: SQL, сериализация и рендер, в секундах."""
+
+    def __init__(self, keep_queries):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.stages = {'serializer': 0.0, 'render': 0.0}
+        self.depth = 0
+        self.keep_queries = keep_queries
+        self.sql = []
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db += duration
+        if len(self.sql) < self.keep_queries:
+            self.sql.append((duration, sql))
+
+    def slowest(self, count):
+        return [{'sql': sql, 'ms': round(duration * 1000, 2)}
+                for duration, sql in sorted(self.sql, key=lambda item: item[0], reverse=True)[:count]]
+
+
+@contextmanager
+def measure(stage):
+    """
+    Добавляет время блока к этапу stage текущего запроса.
+
+    Вложенные блоки не считаются повторно: сериализатор, вызванный из другого
+    сериализатора, уже входит во время внешнего. Вне запроса ничего не делает.
+    """
+    timing = _current.get()
+    if timing is None or timing.depth:
+        yield
+        return
+    timing.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.stages[stage] += time.perf_counter() - started
+        timing.depth -= 1
+
+
+class TimedRepresentationMixin:
+    """Учитывает to_representation сериализатора в этапе serializer текущего запроса."""
+
+    def to_representation(self, instance):
+        with measure('serializer'):
+            return super().to_representation(instance)
+
+
+class RequestTimingMiddleware:
+    """
+    Число и время SQL-запросов, время сериализаторов и рендера для каждого запроса.
+
+    Запросы к базе считаются через connection.execute_wrapper, итоги уходят
+    в заголовок Server-Timing и в лог Car.timing одной JSON-строкой: обычные
+    запросы на уровне DEBUG, медленные (дольше CARS_SLOW_REQUEST_MS) — на
+    WARNING вместе с самыми долгими SQL. Текст запросов не копируется: в
+    памяти держатся ссылки на первые CARS_TIMING_KEEP_QUERIES строк.
+    Те же замеры попадают в гистограммы /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'CARS_SLOW_REQUEST_MS', 500)
+        self.keep_queries = getattr(settings, 'CARS_TIMING_KEEP_QUERIES', 100)
+        self.slow_sql = getattr(settings, 'CARS_SLOW_REQUEST_SQL', 10)
+
+    def __call__(self, request):
+        timing = RequestTiming(self.keep_queries)
+        token = _current.set(timing)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.execute))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - timing.started
+        response['Server-Timing'] = self.server_timing(timing, total)
+        metrics.observe_request(request, response, total, timing.queries, timing.db)
+        self.log(request, response, timing, total)
+        return response
+
+    def execute(self, execute, sql, params, many, context):
+        timing = _current.get()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if timing is not None:
+                timing.record_query(sql, time.perf_counter() - started)
+
+    def process_template_response(self, request, response):
+        # DRF рендерит ответ после всех process_template_response: замеряем до колбэка после рендера
+        timing = _current.get()
+        if timing is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timing.stages['render'] += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def server_timing(self, timing, total):
+        parts = [f'db;dur={timing.db * 1000:.2f};desc="{timing.queries} queries"']
+        parts += [f'{stage};dur={duration * 1000:.2f}' for stage, duration in timing.stages.items()]
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+    def log(self, request, response, timing, total):
+        slow = total * 1000 >= self.slow_ms
+        level = logging.WARNING if slow else logging.DEBUG
+        if not logger.isEnabledFor(level):
+            return
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': getattr(request.resolver_match, 'url_name', None),
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(timing.db * 1000, 2),
+            'queries': timing.queries,
+            **{f'{stage}_ms': round(duration * 1000, 2) for stage, duration in timing.stages.items()},
+        }
+        if slow:
+            record['slowest_sql'] = timing.slowest(self.slow_sql)
+        logger.log(level, json.dumps(record, ensure_ascii=False))
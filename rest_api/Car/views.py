@@ -1,35 +1,233 @@
-from django.db.models import Count, Case, When, Avg
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import mixins
-from rest_framework.filters import SearchFilter, OrderingFilter
+from django_filters.utils import translate_validation
+from rest_framework import mixins, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.mixins import UpdateModelMixin
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.pagination import _positive_int
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
-from .models import CarsModel, UserCarsRelation, LabelsModel
+from .cache import CachedResponseMixin, ConditionalGetMixin, LABELS_PREFIX, cache_stats, get_or_compute, \
+    invalidate_on_commit
+from .facets import facet_counts, facets_signature
+from .filters import CarsFilter
+from .logic import insert_cars, top_cars, upsert_relations
+from .export import stream_serialized
+from .models import CarsModel, CarsTopListing, UserCarsRelation, LabelsModel
+from .pagination import KeysetPagination
+from .parsers import NDJSONParser
+from .search import FullTextSearchFilter, autocomplete
 from .permissions import IsAuthenticatedOwnerOrReadOnly, IsAdminUserOrReadOnly
-from .serializers import CarsSerializer, UserCarsRelationSerializer, LabelsSerializer
+from .serializers import CarsBulkSerializer, CarsCustomersSerializer, CarsSerializer, CarsValuesSerializer, \
+    UserCarsRelationSerializer, LabelsSerializer, cars_columns, validate_relation_rows
 
 
-class CarsAPIViewSet(ModelViewSet):
-    queryset = CarsModel.objects.annotate(
-            likes_count=Count(Case(When(usercarsrelation__like=True, then=1))))\
-            .select_related('owner', 'label')\
-            .prefetch_related('customers').order_by('id')
-            # rating=Avg('usercarsrelation__rate'))\
+class CarsAPIViewSet(ConditionalGetMixin, CachedResponseMixin, ModelViewSet):
+    queryset = CarsModel.objects.select_related('owner', 'label').order_by('id')
 
     serializer_class = CarsSerializer
     permission_classes = [IsAuthenticatedOwnerOrReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['price']
-    search_fields = ['model', 'description', 'label__name']
-    ordering_fields = ['year_of_release', 'price', 'date']
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
+    filterset_class = CarsFilter
+    ordering_fields = ['year_of_release', 'price', 'date', 'likes_count', 'search_rank']
+    export_chunk_size = 1000
+    autocomplete_limit = 10
+    top_limit = 10
+    bulk_batch_size = 5000
+    bulk_max_rows = 10000
+    expand_param = 'expand'
+    fields_param = 'fields'
+
+    def expand_customers(self):
+        return 'customers' in self.request.query_params.get(self.expand_param, '').split(',')
+
+    def get_sparse_fields(self):
+        """Поля из ?fields=id,model,price для чтения; None — все поля."""
+        value = self.request.query_params.get(self.fields_param)
+        if not value or self.request.method not in SAFE_METHODS:
+            return None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = sorted(set(fields) - set(CarsSerializer.Meta.fields))
+        if unknown:
+            raise ValidationError({self.fields_param: [f'Неизвестные поля: {", ".join(unknown)}']})
+        return fields or None
+
+    def use_values(self):
+        # список и выгрузка без полного списка оценивших собираются из values() без моделей
+        return self.action in ('list', 'export') and not self.expand_customers()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'customers':
+            return queryset
+        fields = self.get_sparse_fields()
+        if fields:
+            columns = cars_columns(CarsSerializer(context={'fields': fields}).fields)
+            queryset = queryset.select_related(None)
+            if 'owner_name' in fields:
+                queryset = queryset.select_related('owner')
+            queryset = queryset.only(*columns, *self.get_ordering_columns(queryset))
+        if self.expand_customers():
+            queryset = queryset.prefetch_related('customers')
+        return queryset
+
+    def get_ordering_columns(self, queryset):
+        # курсору нужно значение поля сортировки, даже если его нет среди выводимых полей
+        field, _ = self.paginator.get_ordering(self.request, queryset, self)
+        try:
+            return [queryset.model._meta.get_field(field).name]
+        except FieldDoesNotExist:
+            return []
+
+    def get_values_queryset(self, queryset):
+        columns = CarsValuesSerializer(context=self.get_serializer_context()).columns
+        columns += self.get_ordering_columns(queryset) + list(queryset.query.annotation_select)
+        return queryset.values(*dict.fromkeys(columns))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand_customers'] = self.expand_customers()
+        context['fields'] = self.get_sparse_fields()
+        return context
+
+    def get_serializer(self, *args, **kwargs):
+        if kwargs.get('many') and self.use_values():
+            return CarsValuesSerializer(*args, context=self.get_serializer_context())
+        return super().get_serializer(*args, **kwargs)
+
+    def paginate_queryset(self, queryset):
+        if self.use_values():
+            queryset = self.get_values_queryset(queryset)
+        return super().paginate_queryset(queryset)
 
     def perform_create(self, serializer):
         serializer.validated_data['owner'] = self.request.user
         serializer.save()
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated],
+            parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Массовая загрузка объявлений JSON-массивом или NDJSON.
+
+        Каждая строка проверяется CarsSerializer отдельно: строки с ошибками
+        возвращаются в errors с номером, остальные вставляются insert_cars
+        пачками по bulk_batch_size от имени текущего пользователя.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ValidationError({'non_field_errors': ['Ожидается массив объявлений']})
+        if len(rows) > self.bulk_max_rows:
+            raise ValidationError({'non_field_errors': [f'Не больше {self.bulk_max_rows} объявлений за раз']})
+
+        label_names = {str(row['label']) for row in rows
+                       if isinstance(row, dict) and isinstance(row.get('label'), (str, int))}
+        context = self.get_serializer_context()
+        context['labels'] = LabelsModel.objects.in_bulk(label_names)
+        serializer = CarsBulkSerializer(context=context)
+
+        cars, errors = [], []
+        for number, row in enumerate(rows):
+            try:
+                cars.append(serializer.run_validation(row))
+            except ValidationError as exc:
+                errors.append({'row': number, 'errors': exc.detail})
+
+        with transaction.atomic():
+            ids = insert_cars(cars, request.user, batch_size=self.bulk_batch_size)
+            if ids:
+                # post_save при вставке не вызывается, поэтому кэш списков сбрасываем сами
+                invalidate_on_commit()
+
+        return Response({'created': len(ids), 'ids': ids, 'errors': errors},
+                        status=status.HTTP_201_CREATED if ids or not errors else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False)
+    def export(self, request):
+        ndjson = request.query_params.get('ndjson') in ('1', 'true')
+        queryset, serializer_class = self.filter_queryset(self.get_queryset()), self.get_serializer_class()
+        if self.use_values():
+            queryset, serializer_class = self.get_values_queryset(queryset), CarsValuesSerializer
+        content = stream_serialized(queryset, serializer_class, chunk_size=self.export_chunk_size, ndjson=ndjson,
+                                    context=self.get_serializer_context())
+        content_type = 'application/x-ndjson' if ndjson else 'application/json'
+        return StreamingHttpResponse(content, content_type=f'{content_type}; charset=utf-8')
+
+    @action(detail=False)
+    def facets(self, request):
+        """
+        Счетчики значений фасетов при тех же фильтрах и поиске, что и у списка.
+
+        Ответ один для всех пользователей и кэшируется по набору фильтров
+        до следующего изменения объявлений.
+        """
+        filterset = self.filterset_class(request.query_params, queryset=CarsModel.objects.all(), request=request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        search = FullTextSearchFilter()
+        search_params = {param: request.query_params[param] for param in (search.search_param, search.fuzzy_param)
+                         if param in request.query_params}
+
+        def compute():
+            queryset = None
+            if search.get_search_terms(request):
+                queryset = search.filter_queryset(request, filterset.queryset, self)
+            return facet_counts(filterset, queryset)
+
+        data, hit = get_or_compute('facets', facets_signature(filterset, search_params), compute)
+        return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+    @action(detail=False)
+    def top(self, request):
+        """
+        Популярные объявления по лайкам и рейтингу из CarsTopListing.
+
+        Не больше CarsTopListing.TOP_LISTINGS_SIZE строк по индексу места,
+        поэтому стоимость не зависит от числа объявлений. Порядок обновляется
+        командой refresh_top_listings, поля объявлений — текущие.
+        """
+        try:
+            limit = _positive_int(request.query_params['limit'], strict=True,
+                                  cutoff=CarsTopListing.TOP_LISTINGS_SIZE)
+        except (KeyError, ValueError):
+            limit = self.top_limit
+        serializer = CarsValuesSerializer(context=self.get_serializer_context())
+        serializer.instance = top_cars(limit).values(*serializer.columns)
+        return Response(serializer.data)
+
+    @action(detail=True)
+    def customers(self, request, pk=None):
+        car = self.get_object()
+        relations = UserCarsRelation.objects.filter(car=car).select_related('user')
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(relations, request)
+        return paginator.get_paginated_response(
+            CarsCustomersSerializer([relation.user for relation in page], many=True).data)
+
+    @action(detail=False)
+    def autocomplete(self, request):
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            return Response({'labels': [], 'models': []})
+        try:
+            limit = _positive_int(request.query_params['limit'], strict=True, cutoff=self.autocomplete_limit)
+        except (KeyError, ValueError):
+            limit = self.autocomplete_limit
+        return Response(autocomplete(term, limit=limit))
+
+    @action(detail=False, url_path='cache-stats', permission_classes=[IsAdminUser])
+    def cache_stats(self, request):
+        return Response(cache_stats())
+
 
 class UserCarsRelationView(UpdateModelMixin, GenericViewSet):
     queryset = UserCarsRelation.objects.all()
@@ -37,17 +235,46 @@ class UserCarsRelationView(UpdateModelMixin, GenericViewSet):
     serializer_class = UserCarsRelationSerializer
     lookup_field = 'car'
 
+    bulk_max_rows = 10000
+
     def get_object(self):
         obj, created = UserCarsRelation.objects.get_or_create(user=self.request.user, car_id=self.kwargs['car'])
         return obj
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser],
+            parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Массовая запись лайков и оценок: строки {user, car, like, rate} JSON-массивом или NDJSON.
+
+        Каждая строка — полное состояние отношения. Рейтинг и счетчики
+        пересчитываются один раз на каждое затронутое объявление.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ValidationError({'non_field_errors': ['Ожидается массив отношений']})
+        if len(rows) > self.bulk_max_rows:
+            raise ValidationError({'non_field_errors': [f'Не больше {self.bulk_max_rows} отношений за раз']})
+
+        relations, errors = validate_relation_rows(rows)
+        with transaction.atomic():
+            car_ids = upsert_relations(relations)
+            for car_id in car_ids:
+                invalidate_on_commit(car_id)
+
+        return Response({'applied': len(relations), 'cars': len(car_ids), 'errors': errors},
+                        status=status.HTTP_200_OK if relations or not errors else status.HTTP_400_BAD_REQUEST)
+
 
-class LabelsView(mixins.CreateModelMixin,mixins.RetrieveModelMixin,
+class LabelsView(ConditionalGetMixin, mixins.CreateModelMixin,mixins.RetrieveModelMixin,
                  mixins.DestroyModelMixin,mixins.ListModelMixin,GenericViewSet):
     queryset = LabelsModel.objects.all()
     permission_classes = [IsAdminUserOrReadOnly]
     serializer_class = LabelsSerializer
+    version_prefix = LABELS_PREFIX
+    versioned_detail = False
 
 
 def index(request):
-    return render(request, template_name='Car/index.html')
+    return render(request, template_name='Car/index.html',
+                  context={'top_cars': top_cars(CarsAPIViewSet.top_limit)})
@@ -0,0 +1,19 @@
+from django.db import connections
+
+
+def check_connection(connection):
+    """
+    Закрывает постоянное соединение, которое база уже разорвала.
+
+    То же, что CONN_HEALTH_CHECKS в Django 4.1: без проверки первый запрос
+    после перезапуска Postgres или обрыва по таймауту падает с ошибкой
+    вместо того, чтобы открыть новое соединение.
+    """
+    if connection.settings_dict.get('CONN_HEALTH_CHECKS') and connection.connection is not None \
+            and not connection.in_atomic_block and not connection.is_usable():
+        connection.close()
+
+
+def check_connections(**kwargs):
+    for connection in connections.all():
+        check_connection(connection)
@@ -0,0 +1,108 @@
+import os
+import threading
+
+import psycopg2
+import psycopg2.extras
+from psycopg2 import pool
+
+from django.db.backends.postgresql import base, creation
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # свободные соединения пула держат тестовую базу открытой, и DROP DATABASE не пройдет
+        DatabaseWrapper.close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL с пулом соединений psycopg2 внутри процесса.
+
+    close() возвращает соединение в пул, а следующее подключение берет его
+    оттуда без установки нового. Размер пула и ожидание свободного
+    соединения задаются в OPTIONS['pool']: {'min_size': 1, 'max_size': 10,
+    'timeout': 30}. Пулы разделяются по параметрам подключения и по pid:
+    после fork воркер создает свой.
+    """
+    creation_class = DatabaseCreation
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    @classmethod
+    def close_pools(cls):
+        with cls._pools_lock:
+            for connection_pool, _ in cls._pools.values():
+                connection_pool.closeall()
+            cls._pools.clear()
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_pool(self, conn_params):
+        key = (os.getpid(), tuple(sorted((name, str(value)) for name, value in conn_params.items())))
+        with self._pools_lock:
+            entry = self._pools.get(key)
+            if entry is None or entry[0].closed:
+                options = self.settings_dict['OPTIONS'].get('pool', {})
+                max_size = options.get('max_size', 10)
+                # ThreadedConnectionPool не ждет, а сразу падает при исчерпании: очередь держит семафор
+                entry = self._pools[key] = (
+                    pool.ThreadedConnectionPool(options.get('min_size', 1), max_size, **conn_params),
+                    threading.BoundedSemaphore(max_size),
+                )
+        return entry
+
+    def get_new_connection(self, conn_params):
+        connection_pool, slots = self.get_pool(conn_params)
+        timeout = self.settings_dict['OPTIONS'].get('pool', {}).get('timeout', 30)
+        if not slots.acquire(timeout=timeout):
+            raise psycopg2.OperationalError(f'Нет свободного соединения в пуле за {timeout} с')
+        try:
+            connection = connection_pool.getconn()
+            if self.settings_dict.get('CONN_HEALTH_CHECKS') and not self._usable(connection):
+                connection_pool.putconn(connection, close=True)
+                connection = connection_pool.getconn()
+        except BaseException:
+            slots.release()
+            raise
+        self._pool = (connection_pool, slots)
+
+        # как в postgresql.base.DatabaseWrapper.get_new_connection
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _usable(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            # без autocommit проверка открыла транзакцию, а Django включает autocommit только вне нее
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection_pool, slots = self._pool
+        try:
+            with self.wrap_database_errors:
+                if connection_pool.closed:
+                    self.connection.close()
+                else:
+                    # соединение после ошибки не отдаем другим запросам; незавершенную транзакцию пул откатит сам
+                    connection_pool.putconn(self.connection, close=self.errors_occurred or bool(self.connection.closed))
+        finally:
+            slots.release()
@@ -0,0 +1,13 @@
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+# профиль настроек выбирается переменной окружения DJANGO_ENV: dev (по умолчанию) или prod
+DJANGO_ENV = os.environ.get('DJANGO_ENV', 'dev')
+
+if DJANGO_ENV == 'dev':
+    from .dev import *  # noqa: F401,F403
+elif DJANGO_ENV == 'prod':
+    from .prod import *  # noqa: F401,F403
+else:
+    raise ImproperlyConfigured(f'DJANGO_ENV должен быть dev или prod, а не {DJANGO_ENV!r}')
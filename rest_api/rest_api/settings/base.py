@@ -0,0 +1,185 @@
+import os
+from pathlib import Path
+
+
+# общие настройки профилей dev и prod; профиль выбирает rest_api/settings/__init__.py
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY',
+                            'django-insecure-a3jkpxfg=rl@v0o44^vh_*e17rbcl@xj_#6eruyhutq@=h_nhd')
+
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+
+INSTALLED_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'django.contrib.postgres',
+
+    'rest_framework',
+    'social_django',
+    'django_filters',
+
+    'Car.apps.CarConfig'
+]
+
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'Car.timing.RequestTimingMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+
+ROOT_URLCONF = 'rest_api.urls'
+
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [os.path.join(BASE_DIR, 'templates')],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'social_django.context_processors.backends',
+                'social_django.context_processors.login_redirect'
+            ],
+        },
+    },
+]
+
+
+WSGI_APPLICATION = 'rest_api.wsgi.application'
+
+
+# нужен PostgreSQL: на нем построены полнотекстовый поиск (tsvector, GIN), фасеты (GROUPING SETS),
+# счетчики (INSERT ... ON CONFLICT) и рейтинг популярных объявлений (материализованное представление);
+# на других базах миграции и тесты не проходят
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'cars_db'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'kazlina45'),
+        # сколько секунд держать соединение между запросами; 0 — новое соединение на каждый запрос
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        # проверять постоянное соединение SELECT 1 в начале запроса (как в Django 4.1, см. rest_api.db)
+        'CONN_HEALTH_CHECKS': False,
+    }
+}
+
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+CARS_CACHE_ALIAS = 'default'
+CARS_CACHE_TIMEOUT = 300
+# кэш ответов, ETag и кэш фасетов работают только с кэшем, общим для всех процессов (Redis);
+# кэш в памяти процесса допустим, лишь когда процесс один
+CARS_CACHE_ALLOW_LOCAL = False
+
+# пересчет рейтинга после оценки: 'sync' — в том же запросе, 'thread' — фоновым потоком процесса,
+# 'queue' — через таблицу очереди и команду process_rating_queue
+CARS_RATING_MODE = os.environ.get('CARS_RATING_MODE', 'sync')
+# сколько секунд копить оценки, прежде чем пересчитать объявления одной пачкой
+CARS_RATING_WINDOW = 1.0
+
+# RequestTimingMiddleware: с какой длительности (мс) запрос пишется в лог Car.timing вместе с SQL,
+# сколько самых долгих SQL туда попадает и сколько первых запросов запоминается для выбора
+CARS_SLOW_REQUEST_MS = 500
+CARS_SLOW_REQUEST_SQL = 10
+CARS_TIMING_KEEP_QUERIES = 100
+
+# каталог для метрик нескольких процессов (gunicorn): каждый воркер пишет туда свой снимок
+# не чаще раза в CARS_METRICS_FLUSH_INTERVAL секунд; перед запуском каталог нужно очищать
+CARS_METRICS_DIR = os.environ.get('CARS_METRICS_DIR')
+CARS_METRICS_FLUSH_INTERVAL = 1.0
+# с каких адресов и подсетей (через запятую) /metrics доступен без входа сотрудника;
+# адрес берется из REMOTE_ADDR, поэтому сборщик должен обращаться к воркерам напрямую, а не через прокси
+CARS_METRICS_ALLOWED_IPS = [network.strip() for network in
+                            os.environ.get('CARS_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if network.strip()]
+
+# ?count=1 в списке объявлений: от скольких строк по оценке планировщика отдавать ее вместо точного COUNT(*)
+CARS_COUNT_EXACT_THRESHOLD = 10000
+
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+AUTHENTICATION_BACKENDS = (
+    'social_core.backends.github.GithubOAuth2',
+    'django.contrib.auth.backends.ModelBackend',
+)
+
+
+LANGUAGE_CODE = 'ru'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = False
+
+STATIC_URL = 'static/'
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+LOGIN_REDIRECT_URL = '/'
+
+SOCIAL_AUTH_POSTGRES_JSONFIELD = True
+
+
+SOCIAL_AUTH_GITHUB_KEY = os.environ.get('SOCIAL_AUTH_GITHUB_KEY', '98ec5c2608dc418f4d19')
+SOCIAL_AUTH_GITHUB_SECRET = os.environ.get('SOCIAL_AUTH_GITHUB_SECRET', '85012103bdfb9f590f09e58e96fc1ae1de287745')
+
+# REST_FRAMEWORK = {
+#     'DEFAULT_RENDERER_CLASSES': (
+#         'rest_framework.renderers.JSONRenderer',
+#     ),
+#     'DEFAULT_PARSER_CLASSES': (
+#         'rest_framework.parsers.JSONParser',
+#     )
+# }
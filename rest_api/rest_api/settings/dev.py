@@ -0,0 +1,18 @@
+from .base import *  # noqa: F401,F403
+from .base import INSTALLED_APPS, MIDDLEWARE
+
+DEBUG = True
+
+INSTALLED_APPS = INSTALLED_APPS + ['debug_toolbar']
+
+MIDDLEWARE = MIDDLEWARE + [
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'debug_toolbar_force.middleware.ForceDebugToolbarMiddleware',
+]
+
+# runserver — один процесс, поэтому без REDIS_URL кэш в его памяти не устаревает
+CARS_CACHE_ALLOW_LOCAL = True
+
+INTERNAL_IPS = [
+    '127.0.0.1',
+]
@@ -0,0 +1,49 @@
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .base import *  # noqa: F401,F403
+from .base import DATABASES
+
+DEBUG = False
+
+try:
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+    ALLOWED_HOSTS = os.environ['DJANGO_ALLOWED_HOSTS'].split(',')
+    # кэш ответов, ETag, фасеты и сброс версий из команд рассчитаны на кэш, общий для всех воркеров
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+except KeyError as exc:
+    raise ImproperlyConfigured(f'Для профиля prod нужна переменная окружения {exc.args[0]}')
+
+# постоянные соединения: без них каждый запрос платит за TCP, аутентификацию и запуск backend-процесса
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+if os.environ.get('DB_POOL'):
+    # пул psycopg2 в процессе: соединение возвращается в пул в конце каждого запроса
+    # и достается следующим, в том числе из другого потока
+    DATABASES['default'].update({
+        'ENGINE': 'rest_api.db.pooled',
+        'CONN_MAX_AGE': 0,
+    })
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+    }
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # медленные запросы с SQL от RequestTimingMiddleware
+        'Car.timing': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -4,6 +4,7 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
 
+from Car.metrics import metrics_view
 from Car.views import CarsAPIViewSet, UserCarsRelationView, LabelsView
 
 
@@ -16,13 +17,15 @@ router.register('labels', LabelsView)
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('social_django.urls', namespace='social')),
+    path('', include('Car.urls')),
+    path('metrics', metrics_view, name='metrics'),
 
 ]
 
 urlpatterns += router.urls
 
 
-if settings.DEBUG:
+if 'debug_toolbar' in settings.INSTALLED_APPS:
     import debug_toolbar
 
     import mimetypes